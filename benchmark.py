@@ -0,0 +1,243 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import loader
+
+# Tailles de fichiers mesurées par défaut (nombre de lignes)
+SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+RESULTS_PATH = 'benchmarks/results.jsonl'
+BENCHMARK_DATA_DIR = 'benchmarks/data'
+# Nombre de lignes générées à la fois, pour borner la mémoire du générateur
+GENERATOR_CHUNK_ROWS = 500_000
+
+# Temps d'import (python -X importtime) : modules importés seulement à leur
+# première utilisation, modules nécessaires à tout usage (exclus du temps
+# propre du module) et budget du temps propre, en millisecondes
+LAZY_MODULES = ('requests', 'scipy')
+REQUIRED_MODULES = ('numpy', 'pandas')
+IMPORT_TIME_BUDGET_MS = 50
+
+# Valeurs sales reproduisant celles de data/MMM_MMM_DAE.csv et des fixtures
+NOMS = ['Plateau sportif de GrammontTerrain 9, 10, 11', 'MEDIATHEQUE JEAN-JACQUES ROUSSEAU',
+        'Piscine centre nautique neptune', 'Centre Culturel Rabelais', 'EHPAD "Michel BELORGEOT"',
+        'Gymnase François Spinosi', "Siège du CCAS (Banque d'Acceuil)", 'Hôtel de Ville', ' ']
+ADR_NUMS = [' ', '-', '19 bis', '694 -700', '219 - 289', '424 - 460', '1 place Jacques Mirouse, MONTPELLIER']
+STREETS = ['avenue albert Einstein', 'rue Jacques-Bounin', 'rue de Saint Hilaire 34000 Montpellier',
+           'boulevard Sarrail', 'rue durand', '1 place Jacques Mirouse, MONTPELLIER', 'impasse des Moulins',
+           ' rond-point Benjamin Franklin', 'Rue Pierre Gilles de Gennes', 'place  Thermidor',
+           'avenue du Dr Jacques Fourcade 34000 Montpellier', 'Avenue De Malbosc', "Boulevard d'Antigone",
+           'rue Viollet-le-Duc', '-', ' ']
+POSTAL_CODES = ['34000', '34070', '34080', '34090', '0']
+CITIES = ['Montpellier', 'MONTPELLIER', ' ']
+PHONE_SHAPES = ['334 {} {} {} {}', '+334 {}  {} {} {}', '06 {} {} {} {}', '\n334 {} {} {} {}', '-', ' ']
+FREQUENCIES = ['tous les ans', 'Tous les ans', 'Tout les ans', ' ']
+DATES = ['2019-05-15', '2019-12-01', '2018-12-6', '2020-11-06', ' ', 'Tous les ans']
+
+
+def generate_dirty_data(n_rows:int, path:str, seed:int=0) -> str:
+    """Write a DAE-shaped csv of n_rows rows with the dirt patterns of the real export"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    written = 0
+    while True:
+        chunk = _dirty_chunk(rng, min(GENERATOR_CHUNK_ROWS, n_rows - written), first_id=written)
+        chunk.to_csv(path, mode='a' if written else 'w', header=not written, index=False)
+        written += len(chunk)
+        if written >= n_rows:
+            return path
+
+
+def _dirty_chunk(rng:np.random.Generator, n:int, first_id:int) -> pd.DataFrame:
+    def pick(values, p=None):
+        return rng.choice(np.array(values, dtype=object), size=n, p=p)
+
+    def pairs():
+        return np.char.zfill(rng.integers(0, 100, n).astype(str), 2)
+
+    # Numéros de voie : des nombres simples le plus souvent, sinon des formes sales
+    adr_num = rng.integers(1, 3000, n).astype(str).astype(object)
+    dirty = rng.random(n) < 0.3
+    adr_num[dirty] = pick(ADR_NUMS)[dirty]
+
+    # Numéros de téléphone construits à partir des formes observées
+    shapes = rng.choice(len(PHONE_SHAPES), size=n, p=[0.6, 0.1, 0.1, 0.05, 0.05, 0.1])
+    tel1 = np.empty(n, dtype=object)
+    for position, shape in enumerate(PHONE_SHAPES):
+        parts = shape.split('{}')
+        tel = np.full(n, parts[0])
+        for part in parts[1:]:
+            tel = np.char.add(np.char.add(tel, pairs()), part)
+        tel1[shapes == position] = tel[shapes == position]
+
+    # Coordonnées inversées comme dans l'export, avec des "-" et des vides
+    lat = (3.8 + rng.random(n) * 0.15).round(12).astype(str).astype(object)
+    long = (43.55 + rng.random(n) * 0.1).round(12).astype(str).astype(object)
+    lat[rng.random(n) < 0.1] = '-'
+    long[rng.random(n) < 0.1] = ' '
+
+    return pd.DataFrame({
+        'nom': pick(NOMS),
+        'lat_coor1': lat,
+        'x': (765000 + rng.random(n) * 15000).round(2),
+        'long_coor1': long,
+        'y': (6270000 + rng.random(n) * 15000).round(2),
+        'adr_num': adr_num,
+        'adr_voie': pick(STREETS),
+        'com_cp': pick(POSTAL_CODES, p=[0.3, 0.15, 0.05, 0.05, 0.45]),
+        'com_nom': pick(CITIES, p=[0.9, 0.02, 0.08]),
+        'photo1': ' ',
+        'tel1': tel1,
+        'date_insta': pick(DATES),
+        'freq_mnt': pick(FREQUENCIES),
+        'dermnt': pick(DATES),
+        'ref': ' ',
+        'id': np.arange(first_id, first_id + n),
+    })
+
+
+def run_benchmark(n_rows:int, data_dir:str=BENCHMARK_DATA_DIR, seed:int=0, memory:bool=False, **kwargs) -> dict:
+    """Time each stage and the whole load_clean_data on a generated file of n_rows rows"""
+    path = os.path.join(data_dir, f'dirty-{n_rows}-{seed}.csv')
+    if not os.path.exists(path):
+        generate_dirty_data(n_rows, path, seed=seed)
+
+    # Mesure à froid : le cache des valeurs uniques est vidé
+    loader.SANITIZE_CACHE.clear()
+    if memory:
+        tracemalloc.start()
+    try:
+        with loader.record_stages() as records:
+            start = time.perf_counter()
+            df = loader.load_clean_data(path, **kwargs)
+            total = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+    stages = {}
+    for record in records:
+        stages[record['stage']] = stages.get(record['stage'], 0) + record['wall_time']
+    return {
+        'rows': n_rows,
+        'rows_out': len(df),
+        'total_time': total,
+        'rows_per_second': n_rows / total if total else None,
+        'stages': stages,
+        'tracemalloc_peak': peak,
+        'max_rss_kb': max((record['max_rss_kb'] or 0 for record in records), default=None),
+        'options': {key: value for key, value in kwargs.items() if value is not None},
+    }
+
+
+def run_benchmarks(sizes=SIZES, results_path:str=RESULTS_PATH, **kwargs) -> list:
+    """Run the benchmark for each size and append the results to results_path (json lines)"""
+    context = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+    }
+    results = []
+    for n_rows in sizes:
+        result = {**context, **run_benchmark(n_rows, **kwargs)}
+        results.append(result)
+        print(_format_result(result))
+        if results_path:
+            os.makedirs(os.path.dirname(results_path) or '.', exist_ok=True)
+            with open(results_path, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+    return results
+
+
+def compare_results(results_path:str=RESULTS_PATH, last:int=5) -> pd.DataFrame:
+    """Throughput (rows/s) of the last runs stored in results_path, by size"""
+    results = pd.read_json(results_path, lines=True)
+    results['run'] = results['date'].astype(str) + ' ' + results['revision'].fillna('')
+    history = results.pivot_table(index='run', columns='rows', values='rows_per_second', aggfunc='last')
+    return history.tail(last)
+
+
+def measure_import_time(module:str='loader', runs:int=5) -> dict:
+    """Import time of module in fresh interpreters (python -X importtime), best of runs.
+
+    own_time is the import time without the REQUIRED_MODULES, lazy_imported
+    the LAZY_MODULES loaded by the import anyway.
+    """
+    best = None
+    for _ in range(runs):
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                capture_output=True, text=True, check=True).stderr
+        # Lignes "import time: self [us] | cumulative | imported package"
+        times = {}
+        for line in stderr.splitlines():
+            fields = line.removeprefix('import time:').split('|')
+            if line.startswith('import time:') and fields[1].strip().isdigit():
+                times[fields[2].strip()] = int(fields[1]) / 1e6
+        result = {
+            'module': module,
+            'import_time': times[module],
+            'own_time': times[module] - sum(times.get(name, 0) for name in REQUIRED_MODULES),
+            'lazy_imported': [name for name in LAZY_MODULES if name in times],
+        }
+        if best is None or result['own_time'] < best['own_time']:
+            best = result
+    return best
+
+
+def check_import_time(modules=('loader', 'spatial', 'lookup'), budget_ms:float=IMPORT_TIME_BUDGET_MS) -> bool:
+    """Print the import time of modules, False when one is over budget or loads a lazy module"""
+    ok = True
+    for module in modules:
+        result = measure_import_time(module)
+        over_budget = result['own_time'] * 1000 > budget_ms
+        ok = ok and not over_budget and not result['lazy_imported']
+        print(f"{module:>10}  {result['import_time'] * 1000:7.1f}ms  own {result['own_time'] * 1000:6.1f}ms"
+              f"{'  over budget' if over_budget else ''}"
+              f"{'  imports ' + ', '.join(result['lazy_imported']) if result['lazy_imported'] else ''}")
+    return ok
+
+
+def _format_result(result:dict) -> str:
+    stages = ', '.join(f'{stage} {seconds:.3f}s' for stage, seconds in result['stages'].items())
+    return f"{result['rows']:>10} rows  {result['total_time']:8.3f}s  {result['rows_per_second']:12.0f} rows/s  ({stages})"
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the cleaning pipeline on generated dirty data')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES, help='number of rows of each run')
+    parser.add_argument('--results', default=RESULTS_PATH, help='json lines file the results are appended to')
+    parser.add_argument('--data-dir', default=BENCHMARK_DATA_DIR, help='where the generated csv are kept')
+    parser.add_argument('--memory', action='store_true', help='measure the peak memory with tracemalloc (slower)')
+    parser.add_argument('--chunksize', type=int, help='run load_clean_data by chunks')
+    parser.add_argument('--workers', type=int, help='run load_clean_data in a process pool')
+    parser.add_argument('--compare', action='store_true', help='only print the throughput of the last runs')
+    parser.add_argument('--import-time', action='store_true',
+                        help=f'only check the import time (own time under {IMPORT_TIME_BUDGET_MS}ms, no lazy module)')
+    args = parser.parse_args()
+
+    if args.import_time:
+        sys.exit(0 if check_import_time() else 1)
+    elif args.compare:
+        print(compare_results(args.results))
+    else:
+        run_benchmarks(args.sizes, results_path=args.results, data_dir=args.data_dir, memory=args.memory,
+                       chunksize=args.chunksize, workers=args.workers)
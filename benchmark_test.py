@@ -0,0 +1,39 @@
+import json
+
+import pandas as pd
+
+
+def test_generate_dirty_data(tmp_path):
+    from benchmark import generate_dirty_data
+    from loader import load_clean_data
+    fname = generate_dirty_data(500, tmp_path / 'dirty.csv')
+    dirty = pd.read_csv(fname, dtype=str, keep_default_na=False)
+    assert len(dirty) == 500
+    assert (dirty['lat_coor1'] == '-').any() and (dirty['com_cp'] == '0').any()
+    assert dirty['tel1'].str.startswith('334 ').any() and dirty['adr_num'].str.contains(' -').any()
+
+    df = load_clean_data(fname)
+    assert len(df) == 500
+    assert df['tel1'].dropna().str.fullmatch(r'\+33 \d \d{2} \d{2} \d{2} \d{2}').all()
+    assert not df['address'].str.contains('MONTPELLIER').any()
+
+
+def test_run_benchmarks(tmp_path):
+    from benchmark import compare_results, run_benchmarks
+    results_path = tmp_path / 'results.jsonl'
+    run_benchmarks([100, 200], results_path=results_path, data_dir=tmp_path, memory=True)
+    with open(results_path) as f:
+        results = [json.loads(line) for line in f]
+    assert [result['rows'] for result in results] == [100, 200]
+    assert results[0]['tracemalloc_peak'] > 0
+    assert {'load_formatted_data', 'sanitize_data', 'frame_data'} <= set(results[0]['stages'])
+    assert list(compare_results(results_path).columns) == [100, 200]
+
+
+def test_import_time():
+    from benchmark import measure_import_time
+    for module in ['loader', 'spatial']:
+        result = measure_import_time(module, runs=1)
+        # requests et scipy ne sont importés qu'à leur première utilisation
+        assert result['lazy_imported'] == []
+        assert 0 < result['own_time'] < result['import_time']
@@ -1,90 +1,649 @@
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
+import logging
 import os
-import requests
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
 import numpy as np
 import pandas as pd
-import re
+from pandas.api.types import union_categoricals
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 DATA_PATH = 'data/MMM_MMM_DAE.csv'
 
-def download_data(url, force_download=False, ):
-    # Utility function to donwload data if it is not in disk
-    data_path = os.path.join('data', os.path.basename(url.split('?')[0]))
-    if not os.path.exists(data_path) or force_download:
-        # ensure data dir is created
-        os.makedirs('data', exist_ok=True)
-        # request data from url
-        response = requests.get(url, allow_redirects=True)
-        # save file
-        with open(data_path, "w") as f:
-            # Note the content of the response is in binary form: 
-            # it needs to be decoded.
-            # The response object also contains info about the encoding format
-            # which we use as argument for the decoding
-            f.write(response.content.decode(response.apparent_encoding))
+# Téléchargement : taille des blocs écrits sur disque, taille du préfixe
+# utilisé pour détecter l'encodage et délai d'attente du serveur (secondes)
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+ENCODING_PREFIX_SIZE = 1 << 16
+DOWNLOAD_TIMEOUT = 60
+# Une session par thread : requests ne garantit pas qu'une Session soit thread-safe
+_SESSIONS = threading.local()
+
+# Ligne de commande (voir main) : téléchargements simultanés par défaut et
+# formats de sortie avec l'extension des fichiers écrits
+DOWNLOAD_WORKERS = 8
+OUTPUT_FORMATS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+LOGGER = logging.getLogger(__name__)
+# Fonctions appelées avec les mesures de chaque étape du pipeline (voir
+# add_stage_hook). Sans hook enregistré, les étapes ne sont pas mesurées.
+_STAGE_HOOKS = []
+_MEMORY_PEAKS = []
+
+# Version des règles de nettoyage, à incrémenter quand le comportement d'un
+# sanitizer change : elle invalide les caches sur disque (voir load_clean_data)
+CLEANING_VERSION = 2
+
+# Colonnes lues dans l'export et leur type final, les autres sont ignorées
+COLUMNS = {
+    'nom': 'string',
+    'adr_num': 'string',
+    'adr_voie': 'string',
+    'com_cp': 'string',
+    'com_nom': 'string',
+    'tel1': 'string',
+    'freq_mnt': 'string',
+    'dermnt': 'string',
+    'lat_coor1': 'float',
+    'long_coor1': 'float',
+}
+# Valeurs lues comme manquantes dans toutes les colonnes, puis par colonne
+NA_VALUES = ['', ' ']
+COLUMN_NA_VALUES = {
+    'lat_coor1': ['-'],
+    'long_coor1': ['-'],
+}
+# Colonnes à faible cardinalité encodées en category avec categorical=True
+CATEGORY_COLUMNS = ('com_nom', 'freq_mnt', 'com_cp')
+# Colonnes assemblées par frame_data en une adresse
+ADDRESS_COLUMNS = ('adr_num', 'adr_voie', 'com_cp', 'com_nom')
+# Colonnes de la sortie du nettoyage, dans l'ordre, et colonnes de l'export
+# dont chacune dépend (voir CleanPlan)
+OUTPUT_COLUMNS = {
+    'nom': ('nom',),
+    'address': ADDRESS_COLUMNS,
+    'tel1': ('tel1',),
+    'freq_mnt': ('freq_mnt',),
+    'dermnt': ('dermnt',),
+    'lat_coor1': ('lat_coor1',),
+    'long_coor1': ('long_coor1',),
+}
+
+# Corrections manuelles de l'export (row_hash,column,value,comment), associées
+# au contenu brut de la ligne (voir row_keys) : une valeur vide donne pd.NA
+CORRECTIONS_PATH = 'data/corrections.csv'
+
+# Colonnes de coordonnées (latitude, longitude) contrôlées par sanitize_coordinates
+COORDINATE_COLUMNS = ('lat_coor1', 'long_coor1')
+# Indicateurs ajoutés par sanitize_coordinates
+COORDINATE_FLAGS = ('coord_swapped', 'coord_out_of_area', 'coord_duplicate')
+# Emprise attendue des défibrillateurs, en degrés : (lon_min, lat_min, lon_max, lat_max)
+COORDINATE_BBOX = (3.6, 43.45, 4.15, 43.8)
+# Projection Lambert-93 (RGF93, ellipsoïde GRS80) des colonnes x/y de l'export
+LAMBERT93 = {
+    'e': 0.0818191910428158,
+    'n': 0.7256077650532670,
+    'c': 11754255.4261,
+    'xs': 700000.0,
+    'ys': 12655612.0499,
+    'lon0': 3.0,
+}
+
+# Colonnes de dates (lues en texte) converties par parse_dates
+DATE_COLUMNS = ('dermnt',)
+# Autres colonnes de dates de l'export, lues en plus avec extra_dates=True
+EXTRA_DATE_COLUMNS = ('date_insta', 'dtpr_lcped', 'dtpr_lcad', 'dtpr_bat')
+# Formats essayés dans l'ordre par parse_dates ("%d" accepte aussi "2018-12-6")
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%Y-%m-%dT%H:%M:%S')
 
+# Formes de numéros acceptées par sanitize_tel_number : chaque préfixe est suivi
+# du chiffre de zone puis de quatre paires de chiffres
+TEL_PREFIXES = {
+    'international': r'\+?\s*33',  # "334 67 ...", "+334 67 ...", "+33 4 67 ..."
+    'international_00': r'0033',   # "0033 4 67 ..."
+    'mobile': r'0(?=[67])',        # "06 58 57 85 24", "07 ..."
+}
+# Séparateurs tolérés entre les groupes de chiffres
+TEL_SEPARATOR = r'[\s.\-]*'
+
+# Règles de normalisation des noms de voies utilisées par sanitize_adr_voie
+# Types de voies : mis en minuscules, le nom qui suit prend une majuscule
+# (sur chaque partie d'un nom composé : "Jacques-Bounin")
+STREET_TYPES = ('avenue', 'rue', 'boulevard', 'place', 'impasse', 'allée',
+                'chemin', 'route', 'quai', 'cours', 'esplanade', 'square',
+                'rond-point')
+# Particules laissées en minuscules après le type de voie ("rue du lavandin")
+STREET_PARTICLES = ('du', 'de', 'des')
+# Particules élidées gardées en minuscules devant le nom ("boulevard d'Antigone")
+STREET_ELISIONS = ("d'", "l'")
+# Bruits retirés du nom de voie : virgules, numéros, nom de la ville
+STREET_NOISE = (r',', r'\d+', r'\b(?:M|montpellier)\b')
+
+# Numéro de voie : début, fin d'une plage ("694 -700") et suffixe ("19 bis"),
+# suivis d'un séparateur ("1 place Jacques Mirouse" => 1) ; "12A" n'est pas reconnu
+ADDRESS_NUMBER = (r'(?P<start>\d+)(?:\s*-\s*(?P<end>\d+))?'
+                  r'(?:\s*(?P<suffix>bis|ter|quater)\b)?(?:[\s,]|$)')
+# Cherché n'importe où dans adr_num ("face au 12"), seulement en tête d'adr_voie
+ADDRESS_NUMBER_PATTERN = r'(?i)(?:^|[\s,])' + ADDRESS_NUMBER
+STREET_NUMBER_PATTERN = r'(?i)^\s*' + ADDRESS_NUMBER
+# Colonnes ajoutées par sanitize_adr_num avec structured=True
+ADDRESS_NUMBER_COLUMNS = ('adr_num_start', 'adr_num_end', 'adr_num_suffix')
+
+
+def download_data(url, force_download=False, data_dir='data'):
+    """Utility function to download data if it is not in disk.
+
+    The body is streamed to a temporary file renamed once complete, so an
+    interrupted download never leaves a truncated csv. An interrupted
+    download is resumed with an HTTP range request, and force_download only
+    re-fetches the file when the server reports a change (ETag/Last-Modified).
+    """
+    data_path = os.path.join(data_dir, os.path.basename(url.split('?')[0]))
+    if os.path.exists(data_path) and not force_download:
+        return data_path
+
+    # ensure data dir is created
+    os.makedirs(data_dir, exist_ok=True)
+    part_path = data_path + '.part'
+    meta = _read_json(data_path + '.meta.json') if os.path.exists(data_path) else {}
+    part_meta = _read_json(part_path + '.json') if os.path.exists(part_path) else {}
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    resume_from = os.path.getsize(part_path) if part_meta else 0
+    if resume_from:
+        # If-Range : le serveur renvoie tout le fichier s'il a changé depuis
+        headers['Range'] = f'bytes={resume_from}-'
+        headers['If-Range'] = part_meta.get('etag') or part_meta.get('last_modified', '')
+
+    # request data from url, in a streaming way
+    with _http_session().get(url, headers=headers, stream=True, allow_redirects=True,
+                             timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304:
+            return data_path
+        if response.status_code == 416 and resume_from:
+            # Le morceau déjà téléchargé était en fait complet
+            validators = part_meta
+        else:
+            response.raise_for_status()
+            validators = {'etag': response.headers.get('ETag'),
+                          'last_modified': response.headers.get('Last-Modified')}
+            _write_json(part_path + '.json', validators)
+            with open(part_path, 'ab' if response.status_code == 206 else 'wb') as f:
+                for block in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(block)
+
+    # Le csv est stocké en utf-8, l'encodage d'origine est détecté sur un préfixe
+    _transcode_to_utf8(part_path, _detect_encoding(part_path))
+    os.replace(part_path, data_path)
+    _write_json(data_path + '.meta.json', validators)
+    os.remove(part_path + '.json')
     return data_path
 
 
-def load_formatted_data(data_frame:str) -> pd.DataFrame:
+def _http_session():
+    """Session of the current thread, its connection pool is reused by its downloads"""
+    session = getattr(_SESSIONS, 'session', None)
+    if session is None:
+        # Import différé : seul le téléchargement utilise requests
+        import requests
+        session = _SESSIONS.session = requests.Session()
+    return session
+
+
+def _detect_encoding(path:str) -> str:
+    """Detect the encoding of a file from its first ENCODING_PREFIX_SIZE bytes"""
+    with open(path, 'rb') as f:
+        prefix = f.read(ENCODING_PREFIX_SIZE)
+    try:
+        # Le dernier caractère du préfixe peut être coupé : décodage incrémental
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        import requests
+        return requests.compat.chardet.detect(prefix)['encoding'] or 'utf-8'
+
+
+def _transcode_to_utf8(path:str, encoding:str):
+    if codecs.lookup(encoding).name == 'utf-8':
+        return
+    with open(path, encoding=encoding, newline='') as source, \
+            open(path + '.utf8', 'w', encoding='utf-8', newline='') as target:
+        for block in iter(lambda: source.read(DOWNLOAD_CHUNK_SIZE), ''):
+            target.write(block)
+    os.replace(path + '.utf8', path)
+
+
+def _read_json(path:str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path:str, content:dict):
+    with open(path, 'w') as f:
+        json.dump(content, f)
+
+
+def add_stage_hook(hook):
+    """Register hook(record) to be called after each pipeline stage.
+
+    record is a dict: stage, wall_time and cpu_time (seconds), rows_in,
+    rows_out, na_counts of the output, max_rss_kb of the process and
+    tracemalloc_peak (bytes allocated at the peak of the stage, only while
+    tracemalloc is tracing).
+    Hooks run in the process executing the stage (see workers).
+    """
+    _STAGE_HOOKS.append(hook)
+    return hook
+
+
+def remove_stage_hook(hook):
+    _STAGE_HOOKS.remove(hook)
+
+
+def log_stage(record:dict):
+    """Stage hook writing the record as a json line to the module logger"""
+    LOGGER.info(json.dumps(record, default=str))
+
+
+@contextlib.contextmanager
+def record_stages():
+    """Collect the stage records of the enclosed calls in a list"""
+    records = []
+    add_stage_hook(records.append)
+    try:
+        yield records
+    finally:
+        remove_stage_hook(records.append)
+
+
+def _stage(func):
+    """Decorator measuring a pipeline stage for the registered hooks"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _STAGE_HOOKS:
+            return func(*args, **kwargs)
+
+        df_in = args[0] if args else None
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Les étapes s'emboîtent (sanitize_data appelle les sanitize_*) :
+            # chaque étape remonte son pic à l'étape qui l'englobe
+            memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            _MEMORY_PEAKS.append(0)
+        wall, cpu = time.perf_counter(), time.process_time()
+        memory_peak = None
+        try:
+            df = func(*args, **kwargs)
+        finally:
+            # Dépilé même si l'étape lève : sinon les étapes suivantes lisent son pic
+            if tracing:
+                memory_peak = max(tracemalloc.get_traced_memory()[1], _MEMORY_PEAKS.pop())
+                if _MEMORY_PEAKS:
+                    _MEMORY_PEAKS[-1] = max(_MEMORY_PEAKS[-1], memory_peak)
+                memory_peak -= memory_start
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        record = {
+            'stage': func.__name__,
+            'wall_time': wall,
+            'cpu_time': cpu,
+            'rows_in': len(df_in) if isinstance(df_in, pd.DataFrame) else None,
+            'rows_out': len(df),
+            'na_counts': {column: int(count) for column, count in df.isna().sum().items()},
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+            'tracemalloc_peak': memory_peak,
+        }
+        for hook in _STAGE_HOOKS:
+            hook(record)
+        return df
+    return wrapper
+
+
+@_stage
+def load_formatted_data(data_frame:str, engine:str=None, verbose:bool=False,
+                        string_storage:str=None, extra_dates:bool=False) -> pd.DataFrame:
     """ One function to read csv into a dataframe with appropriate types/formats.
         Note: read only pertinent columns, ignore the others.
+        string_storage='pyarrow' reads the text columns as string[pyarrow].
+        extra_dates=True also reads the EXTRA_DATE_COLUMNS.
     """
-    # Lis le CSV et remplace toutes les strings égales à "" ou " " par des pd.NA
-    df = pd.read_csv(data_frame,
-                     delimiter= ',',
-                     na_values=['', ' ']
-                       )
-    
-    # Remplace les "-" par des pd.NA 
-    df['lat_coor1'] = df['lat_coor1'].replace('-', pd.NA)
-    df['long_coor1'] = df['long_coor1'].replace('-', pd.NA)
+    # Lis uniquement les colonnes de COLUMNS, directement dans leur type final
+    df = format_data(next(_read_columns(data_frame, engine=engine, columns=_columns(extra_dates),
+                                        string_storage=string_storage)))
 
-    # Convertis en float les valeurs de la colonne, si la valeur ne peut pas etre convertis => pd.NA
-    df['lat_coor1'] = pd.to_numeric(df['lat_coor1'],errors='coerce')
-    df['long_coor1'] = pd.to_numeric(df['long_coor1'],errors='coerce')
+    if verbose:
+        for column in df.columns:
+            print(f"{column}: {df[column].dtype}")
 
-    # Remplace les pd.NA par des np.NaN 
-    df['lat_coor1'] = df['lat_coor1'].replace('<NA>', np.NaN)
-    df['long_coor1'] = df['long_coor1'].replace('<NA>', np.NaN)
+    return df
 
 
-    # Replace NaN values by NA values, since those values are not numerical they cannot be considered as NaN values.
-    df[['nom','adr_num', 'adr_voie', 'com_cp', 'com_nom', 'tel1', 'freq_mnt']] = df[['nom','adr_num', 'adr_voie', 'com_cp', 'com_nom', 'tel1', 'freq_mnt']].replace(np.NaN, pd.NA)
+@_stage
+def format_data(df:pd.DataFrame) -> pd.DataFrame:
+    """Finish the formatting of freshly read rows (a whole file or a chunk)"""
+    # Cas particuliers (valeurs inversées dans le csv de base...) : corrections
+    # manuelles de CORRECTIONS_PATH, avant la conversion des dates
+    df = apply_corrections(df)
+    return parse_dates(df)
 
-    # Cas particulier, deux valeurs sont inversées dans le dans le csv de bas, la prof a décidé de directement les remplacer par des NA dès le formatage  => pd.NA
-    df.loc[5, 'freq_mnt'] = pd.NA
-    df.loc[5, 'dermnt'] = pd.NA
 
-    df = df.astype({
-    'nom': 'string',
-    'adr_num': 'string',
-    'adr_voie': 'string',
-    'com_cp': 'string',
-    'com_nom': 'string',
-    'tel1': 'string',
-    'freq_mnt': 'string',
-    'dermnt': 'string',
+@_stage
+def apply_corrections(df:pd.DataFrame, corrections_path:str=None) -> pd.DataFrame:
+    """ One function to apply the manual corrections (CORRECTIONS_PATH by default) to freshly read rows
 
-})
-    df['dermnt'] = pd.to_datetime(df['dermnt'], errors='coerce')
+    Corrections are keyed by the hash of the raw row (see row_keys), so they
+    follow the record whatever its position, chunk or partition, and are
+    applied with one hash index lookup per corrected column.
+    """
+    corrections = _corrections(CORRECTIONS_PATH if corrections_path is None else corrections_path)
+    if not corrections:
+        return df
+    keys = _hash_rows(df).to_numpy()
+    for column, values in corrections.items():
+        if column not in df.columns:
+            continue
+        positions = values.index.get_indexer(keys)
+        rows = positions >= 0
+        if rows.any():
+            df.loc[rows, column] = values.iloc[positions[rows]].astype(df[column].dtype).array
+    return df
 
-    for column in df.columns:
-        print(f"{column}: {df[column].dtype}")
 
+def row_keys(data_path:str) -> pd.Series:
+    """Correction key (row_hash of CORRECTIONS_PATH) of each row of data_path"""
+    return _hash_rows(next(_read_columns(data_path)))
+
+
+def _hash_rows(raw:pd.DataFrame) -> pd.Series:
+    """Hash of the COLUMNS of freshly read rows, whatever their position, chunk or string storage"""
+    return pd.util.hash_pandas_object(raw[list(COLUMNS)], index=False)
+
+
+def _corrections(corrections_path:str) -> dict:
+    if not corrections_path or not os.path.exists(corrections_path):
+        return {}
+    stat = os.stat(corrections_path)
+    return _load_corrections(os.path.abspath(corrections_path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_corrections(corrections_path:str, size:int, mtime_ns:int) -> dict:
+    """Corrections by column, as values indexed by row hash (read once per process and version of the file)"""
+    corrections = pd.read_csv(corrections_path, usecols=['row_hash', 'column', 'value'],
+                              dtype={'row_hash': 'uint64', 'column': 'string', 'value': 'string'},
+                              keep_default_na=False, na_values={'value': NA_VALUES})
+    duplicated = corrections.duplicated(['row_hash', 'column'])
+    if duplicated.any():
+        raise ValueError(f'Several corrections of the same value in {corrections_path}: '
+                         f'{corrections[duplicated].to_dict("records")}')
+    return {column: pd.Series(group['value'].array, index=pd.Index(group['row_hash'].to_numpy()))
+            for column, group in corrections.groupby('column')}
+
+
+@_stage
+def parse_dates(df:pd.DataFrame, columns:list=None, formats:tuple=None, failures:dict=None) -> pd.DataFrame:
+    """ One function to parse the date columns (DATE_COLUMNS and EXTRA_DATE_COLUMNS present in df)
+
+    The formats (DATE_FORMATS by default) are tried in turn, each in one
+    vectorized pass over the distinct values not parsed yet, and the parsed
+    values are cached. Values matching no format become NaT, their row labels
+    are stored by column in failures when a dict is given.
+    """
+    if columns is None:
+        columns = [column for column in DATE_COLUMNS + EXTRA_DATE_COLUMNS if column in df.columns]
+    formats = tuple(formats or DATE_FORMATS)
+    for column in columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            continue
+        parsed = clean_uniques(df[column], functools.partial(_parse_formats, formats=formats),
+                               namespace=('dates', formats), dtype='datetime64[ns]')
+        if failures is not None:
+            failures[column] = df.index[(df[column].notna() & parsed.isna()).to_numpy()]
+        df[column] = parsed
     return df
 
 
+def _parse_formats(values:pd.Series, formats:tuple) -> pd.Series:
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    remaining = values.notna().to_numpy()
+    for date_format in formats:
+        if not remaining.any():
+            break
+        parsed[remaining] = pd.to_datetime(values[remaining], format=date_format, errors='coerce')
+        remaining &= parsed.isna().to_numpy()
+    return parsed
+
+
+def _columns(extra_dates:bool=False) -> dict:
+    """COLUMNS, plus the EXTRA_DATE_COLUMNS (read as text) with extra_dates=True"""
+    if not extra_dates:
+        return COLUMNS
+    return {**COLUMNS, **{column: 'string' for column in EXTRA_DATE_COLUMNS}}
+
+
+def _read_columns(data_path:str, engine:str=None, chunksize:int=None, columns:dict=None,
+                  string_storage:str=None):
+    """Yield the columns (COLUMNS by default) of the csv with their NA tokens and dtypes.
+
+    The whole file is a single chunk when chunksize is None. Row labels
+    follow the position in the file, whatever the chunk. The text columns
+    use string_storage ('python' or 'pyarrow'), pandas' default when None.
+    """
+    if engine == 'pyarrow' and chunksize is not None:
+        # pandas ne lit pas par morceaux avec pyarrow (ni skiprows appelable)
+        raise ValueError("The pyarrow engine reads the whole file at once, it cannot be used with a chunksize "
+                         "(use engine='c' or no engine)")
+    columns = COLUMNS if columns is None else columns
+    if string_storage is not None:
+        # Les sanitizers conservent ensuite le type de chaque colonne
+        columns = {column: pd.StringDtype(string_storage) if dtype == 'string' else dtype
+                   for column, dtype in columns.items()}
+    usecols = list(columns)
+    read_rows = 0
+    if engine != 'pyarrow':
+        na_values = {column: NA_VALUES + COLUMN_NA_VALUES.get(column, []) for column in usecols}
+        try:
+            for chunk in _read_csv(data_path, chunksize, usecols=usecols, dtype=columns,
+                                   na_values=na_values, engine=engine):
+                read_rows += len(chunk)
+                yield chunk[usecols]
+            return
+        except ValueError:
+            # Une valeur non numérique dans une colonne float : on relit les
+            # lignes restantes avec ces colonnes en texte, converties avec errors='coerce'
+            pass
+
+    # Le moteur pyarrow n'accepte pas de valeurs manquantes par colonne : les
+    # colonnes non textuelles sont lues en texte puis converties
+    deferred = [column for column, dtype in columns.items() if dtype != 'string']
+    dtype = {column: 'string' if column in deferred else columns[column] for column in usecols}
+    skiprows = (lambda row: 0 < row <= read_rows) if read_rows else None
+    for chunk in _read_csv(data_path, chunksize, usecols=usecols, dtype=dtype,
+                           na_values=NA_VALUES, engine=engine, skiprows=skiprows):
+        if deferred:
+            chunk[deferred] = _parse_numbers(chunk[deferred], {column: columns[column] for column in deferred})
+        chunk.index += read_rows
+        yield chunk[usecols]
+
+
+def _parse_numbers(frame:pd.DataFrame, dtypes:dict) -> pd.DataFrame:
+    """Parse text columns into numbers in a single pass, NA tokens and unparsable values give NaN"""
+    tokens = frame.isin({column: COLUMN_NA_VALUES.get(column, []) for column in frame.columns})
+    # Toutes les colonnes sont converties ensemble, en un seul to_numeric
+    values = pd.to_numeric(pd.Series(frame.mask(tokens).to_numpy(dtype=object).ravel()), errors='coerce')
+    numbers = pd.DataFrame(values.to_numpy().reshape(frame.shape), index=frame.index, columns=frame.columns)
+    return numbers.astype(dtypes)
+
+
+def _read_csv(data_path:str, chunksize:int=None, **kwargs):
+    if chunksize is None:
+        yield pd.read_csv(data_path, **kwargs)
+    else:
+        with pd.read_csv(data_path, chunksize=chunksize, **kwargs) as reader:
+            yield from reader
+
+
+@functools.lru_cache(maxsize=None)
+def _tel_pattern(prefixes:tuple, separator:str) -> re.Pattern:
+    """Compile once the phone pattern for a given set of accepted prefixes and separator"""
+    return re.compile(r'^\s*(?:' + '|'.join(prefixes) + ')' + separator + r'(\d)'
+                      + (separator + r'(\d{2})') * 4 + r'\s*$')
+
+
+@functools.lru_cache(maxsize=None)
+def _street_rules(street_types:tuple, particles:tuple, elisions:tuple, noise:tuple) -> tuple:
+    """Compile once the street rule table into combined patterns"""
+    # Motif laissé en texte (drapeau en ligne) : les colonnes string[pyarrow]
+    # l'appliquent alors avec le moteur d'Arrow
+    noise = '(?i)' + '|'.join(noise)
+    # Types les plus longs d'abord pour que "rond-point" passe avant "rond"
+    types = '|'.join(re.escape(t) for t in sorted(street_types, key=len, reverse=True))
+    street = re.compile(r'\b(' + types + r')\s+(\S+)', flags=re.IGNORECASE)
+
+    def canonical_street(match):
+        street_type, word = match.group(1).lower(), match.group(2)
+        if word.lower() in particles:
+            return street_type + ' ' + word.lower()
+        elision = ''
+        if word[:2].lower() in elisions and len(word) > 2:
+            elision, word = word[:2].lower(), word[2:]
+        word = '-'.join(part.capitalize() for part in word.split('-'))
+        return street_type + ' ' + elision + word
+
+    return noise, street, canonical_street
+
+
+def _street_rule_table() -> tuple:
+    """The street rules in effect: the key of _street_rules and of the cache namespace"""
+    return tuple(STREET_TYPES), tuple(STREET_PARTICLES), tuple(STREET_ELISIONS), tuple(STREET_NOISE)
+
+
+class UniqueValueCache:
+    """Bounded LRU of cleaned values shared by the string sanitizers.
+
+    Keys are (namespace, raw value), the namespace identifying the transform
+    and its rules, so it persists across load_clean_data calls of a process.
+    maxsize=0 disables the storage but keeps the hit/miss counters.
+    More distinct values than maxsize would only flush the cache: they are
+    cleaned directly and counted as skipped.
+    """
+
+    def __init__(self, maxsize:int=100_000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._values = collections.OrderedDict()
+
+    def info(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'skipped': self.skipped,
+                'size': len(self._values), 'maxsize': self.maxsize}
+
+    def clear(self):
+        self._values.clear()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def transform(self, namespace, uniques:pd.Series, transform) -> list:
+        """Return transform(uniques) as a list, only computing the values not cached"""
+        if len(uniques) > self.maxsize:
+            # Trop de valeurs distinctes : le cache serait vidé sans servir,
+            # la boucle de recherche coûterait plus que la transformation
+            self.skipped += len(uniques)
+            return transform(uniques).tolist()
+        cleaned = [None] * len(uniques)
+        missing = []
+        for position, value in enumerate(uniques):
+            key = (namespace, value)
+            if key in self._values:
+                self._values.move_to_end(key)
+                cleaned[position] = self._values[key]
+            else:
+                missing.append(position)
+        self.hits += len(uniques) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            computed = transform(uniques.iloc[missing]).tolist()
+            raw_values = uniques.array
+            for position, value in zip(missing, computed):
+                cleaned[position] = value
+                if self.maxsize > 0:
+                    self._values[(namespace, raw_values[position])] = value
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+        return cleaned
+
+
+# Cache partagé par les sanitizers, conservé d'un appel à l'autre
+SANITIZE_CACHE = UniqueValueCache()
+
+
+def clean_uniques(series:pd.Series, transform, namespace, cache:UniqueValueCache=None,
+                  dtype=None) -> pd.Series:
+    """Apply a Series -> Series string transform once per distinct value.
+
+    factorize -> clean the uniques (through the cache) -> take back to the rows,
+    so the work is proportional to the number of distinct values. The result
+    has the dtype of series, or dtype when the transform returns another type.
+    """
+    if not isinstance(series.dtype, pd.StringDtype):
+        series = series.astype('string')
+    cache = SANITIZE_CACHE if cache is None else cache
+
+    codes, uniques = pd.factorize(series.array)
+    uniques = pd.Series(uniques, dtype=series.dtype)
+    cleaned = pd.array(cache.transform(namespace, uniques, transform), dtype=dtype or series.dtype)
+
+    # Les codes -1 (valeurs manquantes) redonnent pd.NA
+    return pd.Series(cleaned.take(codes, allow_fill=True), index=series.index, name=series.name)
+
+
 # once they are all done, call them in the general sanitizing function
-def sanitize_data(df:pd.DataFrame) -> pd.DataFrame:
-    """ One function to do all sanitizing"""
-    sanitized_df = sanitize_tel_number(df)
-    sanitized_df = sanitize_adr_num(sanitized_df)
+@_stage
+def sanitize_data(df:pd.DataFrame, copy:bool=True, categorical:bool=False,
+                  coordinates:bool=False, address_numbers:bool=False) -> pd.DataFrame:
+    """ One function to do all sanitizing
+
+    With copy=False the sanitizers work in place on df, for callers owning
+    the frame (load_clean_data), otherwise df is left untouched.
+    With categorical=True the CATEGORY_COLUMNS are returned as category.
+    With coordinates=True the coordinates go through sanitize_coordinates.
+    With address_numbers=True the parsed ADDRESS_NUMBER_COLUMNS are added.
+    """
+    sanitized_df = df.copy() if copy else df
+    sanitized_df = sanitize_tel_number(sanitized_df)
+    sanitized_df = sanitize_adr_num(sanitized_df, structured=address_numbers)
     sanitized_df = sanitize_com_nom(sanitized_df)
     sanitized_df = sanitize_adr_voie(sanitized_df)
     sanitized_df = sanitize_cp(sanitized_df)
     sanitized_df = sanitize_frequence(sanitized_df)
+    if coordinates:
+        sanitized_df = sanitize_coordinates(sanitized_df)
 
-    sanitized_df = sanitized_df.astype({
+    dtypes = {
     'nom': 'string',
     'adr_num': 'string',
     'adr_voie': 'string',
@@ -92,173 +651,991 @@ def sanitize_data(df:pd.DataFrame) -> pd.DataFrame:
     'com_nom': 'string',
     'tel1': 'string',
     'freq_mnt': 'string',
-    'dermnt': 'string',
+}
+    if categorical:
+        for column in CATEGORY_COLUMNS:
+            sanitized_df[column] = sanitized_df[column].astype('category')
+            del dtypes[column]
+    return _ensure_dtypes(sanitized_df, dtypes)
 
-})
-    sanitized_df['dermnt'] = pd.to_datetime(sanitized_df['dermnt'], errors='coerce')
-    return sanitized_df
 
-def sanitize_tel_number(df:pd.DataFrame) -> pd.DataFrame:
+def _ensure_dtypes(df:pd.DataFrame, dtypes:dict) -> pd.DataFrame:
+    """Convert in place the columns not already in their dtype, and the dates not parsed yet"""
+    for column, dtype in dtypes.items():
+        if df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+    if any(not pd.api.types.is_datetime64_any_dtype(df[column])
+           for column in DATE_COLUMNS + EXTRA_DATE_COLUMNS if column in df.columns):
+        df = parse_dates(df)
+    return df
+
+@_stage
+def sanitize_tel_number(df:pd.DataFrame, prefixes:dict=None) -> pd.DataFrame:
     """ One function to fix the format of the phone numbers (+33 X XX XX XX XX)"""
+    prefixes = tuple((prefixes or TEL_PREFIXES).values())
+    # Numéros presque tous distincts : un passage vectorisé direct, sans clean_uniques
+    df['tel1'] = _format_tel(df['tel1'], prefixes, TEL_SEPARATOR)
+    return df
 
-    def format_tel(tel):
-
-        if type(tel) != str :
-            return pd.NA
-        elif re.match(r'^06 \d{2} \d{2} \d{2} \d{2}$', tel):
-            # Enlever le 0 au début et remplacer par "+33"
-            return re.sub(r'^0', '+33', tel)
-        elif re.match(r'^\d{3} \d{2} \d{2} \d{2} \d{2}$', tel):
-            # Si le numéro est déjà au format "334 67 27 46 12"
-            return '+{}'.format(tel)
-        elif re.match(r'^\+33 \d{2} \d{2} \d{2} \d{2}$', tel):
-            # Si le numéro est déjà au format "+334 67 40 04 44"
-            return tel
-        else:
-            return pd.NA
-        
-    df['tel1'] = df['tel1'].str.replace('+','').str.replace("  "," ")
+def _format_tel(tel:pd.Series, prefixes:tuple, separator:str) -> pd.Series:
+    # Un seul passage vectorisé : le motif compilé tolère les préfixes configurés
+    # et les séparateurs, et capture le chiffre de zone puis les quatre paires
+    parts = tel.str.extract(_tel_pattern(prefixes, separator))
 
-    df['tel1'] = df['tel1'].apply(format_tel)
+    # Une valeur qui ne correspond à aucune forme acceptée reste pd.NA
+    return '+33 ' + parts[0].str.cat(parts.iloc[:, 1:], sep=' ')
 
-    df['tel1'] = df['tel1'].str.replace("+33","+33 ")
-    return df
+@_stage
+def sanitize_adr_num(df:pd.DataFrame, structured:bool=False) -> pd.DataFrame:
+    """One function to sanitize the address number column ("694-700", "19 bis")
 
-def sanitize_adr_num(df:pd.DataFrame) -> pd.DataFrame:
-    """One function to sanitize the address number column"""    
-    def clean_address_number(address_num):
-        # Si l'adresse est une chaîne vide ou nulle, laisser telle quelle
-        if pd.isna(address_num) or address_num.strip() == "" or address_num == "-":
-            return pd.NA
-        
-        # Si le numéro d'adresse contient un tiret
-        if "-" in address_num:
-            # Supprimer les espaces inutiles autour du tiret
-            address_num = "-".join(part.strip() for part in address_num.split("-"))
-
-        if any(word.isalpha() for word in address_num.split()) and "bis" not in address_num.lower():
-        # Supprimer les mots sauf "bis"
-            address_num = " ".join(word for word in address_num.split() if word.lower() == "bis" or not word.isalpha())
-
-        return address_num
-    
-    df['adr_num'] = df['adr_num'].str.replace(",", "")
-    df['adr_num'] = df['adr_num'].apply(clean_address_number)
+    The number leading adr_voie is used when adr_num has none, and removed
+    from adr_voie with its suffix ("8 ter rue du Lavandin"). With
+    structured=True, adds the ADDRESS_NUMBER_COLUMNS: adr_num_start and
+    adr_num_end (Int64) and adr_num_suffix.
+    """
+    numbers = _parse_address_numbers(df['adr_num'], df['adr_voie'])
+    df['adr_num'] = numbers['adr_num']
+    df['adr_voie'] = numbers['adr_voie']
+    if structured:
+        for column in ADDRESS_NUMBER_COLUMNS:
+            df[column] = numbers[column]
     return df
 
-import re
+def _parse_address_numbers(adr_num:pd.Series, adr_voie:pd.Series) -> pd.DataFrame:
+    """Parse adr_num, or the number leading adr_voie, with one extract per distinct value.
+
+    Also returns adr_voie, without the number when it was taken from there.
+    """
+    numbers = _extract_uniques(adr_num, ADDRESS_NUMBER_PATTERN)
+    # Valeur non reconnue : sans virgules ni mots alphabétiques ("Bat A", "SN")
+    codes, uniques = pd.factorize(adr_num.str.replace(',', '').array)
+    raw = pd.Series(pd.array([_drop_words(value) for value in uniques], dtype=adr_num.dtype)
+                    .take(codes, allow_fill=True), index=adr_num.index)
+    raw = raw.mask(raw.isin(['', '-']))
+
+    # Un numéro resté dans le nom de voie ("1 place Jacques Mirouse") est récupéré
+    leaked = _extract_uniques(adr_voie, STREET_NUMBER_PATTERN)
+    recovered = (raw.isna() & leaked['start'].notna()).to_numpy()
+    numbers[recovered] = leaked[recovered]
+    # Le numéro récupéré et son suffixe quittent la voie, sinon l'adresse les répète
+    street = adr_voie.copy()
+    street[recovered] = adr_voie[recovered].str.replace(STREET_NUMBER_PATTERN, '', n=1, regex=True)
+
+    suffix = numbers['suffix'].str.lower()
+    display = numbers['start'] + ('-' + numbers['end']).fillna('') + (' ' + suffix).fillna('')
+    return pd.DataFrame({
+        'adr_num': display.fillna(raw).astype(adr_num.dtype),
+        'adr_num_start': numbers['start'].astype('Int64'),
+        'adr_num_end': numbers['end'].astype('Int64'),
+        'adr_num_suffix': suffix.astype(adr_num.dtype),
+        'adr_voie': street,
+    }, index=adr_num.index)
+
+def _drop_words(adr_num:str) -> str:
+    return ' '.join(word for word in adr_num.split() if not word.isalpha())
+
+def _extract_uniques(series:pd.Series, pattern:str) -> pd.DataFrame:
+    """str.extract run once per distinct value, then taken back to the rows"""
+    codes, uniques = pd.factorize(series.array)
+    parts = pd.Series(uniques, dtype=series.dtype).str.extract(pattern)
+    return pd.DataFrame({name: parts[name].array.take(codes, allow_fill=True) for name in parts.columns},
+                        index=series.index)
+
+@_stage
 def sanitize_adr_voie(df: pd.DataFrame) -> pd.DataFrame:
     """One function to sanitize the address name column"""
-    def clean_address(address):
-        if type(address) != str or len(address.strip()) <= 1:
-            return pd.NA
-        
-        # Supprimer "Montpellier"
-        address = re.sub(r'\b(?:M|montpellier)\b', '', address, flags=re.IGNORECASE)
-
-        address = re.sub(r'\d+', '', address)
-
-        # Supprimer les espaces au début et à la fin
-        address = address.strip()
-        
-        # Traitement spécial pour les cas de "rue" suivi de "de"
-        address = address.replace("  "," ").replace("Rue ","rue ")
-   
-        address = re.sub(r'(avenue)(\s+)([^\s]+)', lambda match: match.group(1) + match.group(2) + match.group(3).capitalize(), address, flags=re.IGNORECASE)
-        address = re.sub(r'(rue)(\s+)([^\s]+)', lambda match: match.group(1) + match.group(2) + match.group(3).capitalize(), address, flags=re.IGNORECASE)
-
-        # Gérer l'exception pour "avenue du"
-        address = re.sub(r'(avenue\s+du)(?=\s+[^\s])', lambda match: match.group(1).lower(), address, flags=re.IGNORECASE)
-        address = re.sub(r'(rue\s+du)(?=\s+[^\s])', lambda match: match.group(1).lower(), address, flags=re.IGNORECASE)
-        address = re.sub(r'(rue\s+de)(?=\s+[^\s])', lambda match: match.group(1).lower(), address, flags=re.IGNORECASE)
-
-        if "rue" in address:
-            words = address.split()
-            for word in words:
-                if "-" in word:
-                    word_to_correct_idx = words.index(word)
-                    splitted_name = word.split("-")
-                    splitted_name = [name.capitalize() for name in splitted_name]
-                    corrected_name = splitted_name[0]+"-"+splitted_name[1]
-                    words[word_to_correct_idx] = corrected_name
-            address = " ".join(words)            
-
-        return address.strip()
-
-    df['adr_voie'] = df['adr_voie'].str.replace(",", "")
-    df['adr_voie'] = df['adr_voie'].apply(clean_address)
-    
+    rules = _street_rule_table()
+    df['adr_voie'] = clean_uniques(df['adr_voie'], functools.partial(_clean_adr_voie, rules=rules),
+                                   namespace=('adr_voie',) + rules)
     return df
 
-    
+def _clean_adr_voie(adr_voie:pd.Series, rules:tuple) -> pd.Series:
+    noise, street, canonical_street = _street_rules(*rules)
+
+    # Une voie vide ou d'un seul caractère ("-") n'est pas renseignée
+    adr_voie = adr_voie.where(adr_voie.str.strip().str.len() > 1)
 
+    # Supprimer en un passage les virgules, les numéros et "Montpellier",
+    # puis les espaces en trop
+    adr_voie = adr_voie.str.replace(noise, '', regex=True)
+    adr_voie = adr_voie.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+    # Normaliser le type de voie et le mot qui le suit en un seul passage
+    # (un remplacement par fonction n'existe pas dans Arrow : repli attendu)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        adr_voie = adr_voie.str.replace(street, canonical_street, regex=True)
+    return adr_voie.replace('', pd.NA)
+
+
+@_stage
 def sanitize_com_nom(df:pd.DataFrame) -> pd.DataFrame:
     """One function to do the sanitizing of the city name column"""
-    for i in range(len(df['com_nom'])):
-        if not pd.isna(df['com_nom'][i]):
-            df.loc[i, 'com_nom'] = 'Montpellier'
+    df['com_nom'] = _fill_city(df['com_nom'])
     return df
 
+def _fill_city(com_nom:pd.Series) -> pd.Series:
+    # Toute valeur renseignée devient "Montpellier", les NA restent NA
+    return com_nom.mask(com_nom.notna(), 'Montpellier')
+
+@_stage
 def sanitize_frequence(df: pd.DataFrame) -> pd.DataFrame:
     """One function to do the sanitizing of the frequence maintenance column"""
-    for i in range(0, len(df['freq_mnt'])):
-        if not pd.isna(df['freq_mnt'][i]):
-            # Convertir la chaîne en minuscules
-            df.loc[i, 'freq_mnt'] = df['freq_mnt'][i].lower()
-            # Remplacer "tout" par "tous" dans la chaîne
-            df.loc[i, 'freq_mnt'] = df['freq_mnt'][i].replace('tout', 'tous')
-            # Changer les valeurs en "tous les ans"
-            df.loc[i, 'freq_mnt'] = 'tous les ans'
+    df['freq_mnt'] = _fill_frequency(df['freq_mnt'])
     return df
 
+def _fill_frequency(freq_mnt:pd.Series) -> pd.Series:
+    # Toutes les variantes ("Tous les ans", "Tout les ans", ...) deviennent "tous les ans"
+    return freq_mnt.mask(freq_mnt.notna(), 'tous les ans')
 
 
+
+@_stage
 def sanitize_cp(df:pd.DataFrame) -> pd.DataFrame:
     """One function to do the sanitizing of the postal code column"""
-    for i in range(0, len(df['com_cp'])) :
-        if df['com_cp'][i] == '0':
-            df.loc[i, 'com_cp'] = pd.NA
+    df['com_cp'] = _drop_zero_cp(df['com_cp'])
+    return df
+
+def _drop_zero_cp(com_cp:pd.Series) -> pd.Series:
+    # Un code postal à "0" n'est pas renseigné => pd.NA
+    return com_cp.replace('0', pd.NA)
+
+
+@_stage
+def sanitize_coordinates(df:pd.DataFrame, bbox:tuple=None, projected:bool=False) -> pd.DataFrame:
+    """ One function to check the coordinates against the expected area (COORDINATE_BBOX)
+
+    Pairs that only fall in the area once latitude and longitude are swapped
+    are swapped back. Adds the flags coord_swapped, coord_out_of_area and
+    coord_duplicate (same point as another row of df).
+    With projected=True, adds the Lambert-93 x/y of the export.
+    """
+    lat_column, lon_column = COORDINATE_COLUMNS
+    lon_min, lat_min, lon_max, lat_max = bbox or COORDINATE_BBOX
+    lat = df[lat_column].to_numpy(dtype=float)
+    lon = df[lon_column].to_numpy(dtype=float)
+
+    def in_area(lat, lon):
+        return (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+
+    # Les comparaisons avec NaN sont fausses : une position manquante n'est jamais inversée
+    swapped = ~in_area(lat, lon) & in_area(lon, lat)
+    lat, lon = np.where(swapped, lon, lat), np.where(swapped, lat, lon)
+    located = ~(np.isnan(lat) | np.isnan(lon))
+    df[lat_column] = lat
+    df[lon_column] = lon
+
+    swapped_flag, out_of_area_flag, duplicate_flag = COORDINATE_FLAGS
+    df[swapped_flag] = swapped
+    df[out_of_area_flag] = located & ~in_area(lat, lon)
+    df[duplicate_flag] = False
+    _flag_duplicate_coordinates(df)
+    if projected:
+        df['x'], df['y'] = _lambert93(lat, lon)
+    return df
+
+
+def _flag_duplicate_coordinates(df:pd.DataFrame) -> pd.DataFrame:
+    """Set coord_duplicate over all of df: run again once the chunks are put back together"""
+    lat_column, lon_column = COORDINATE_COLUMNS
+    located = df[lat_column].notna() & df[lon_column].notna()
+    df[COORDINATE_FLAGS[2]] = (located & df.duplicated([lat_column, lon_column], keep=False)).to_numpy()
     return df
 
 
+def _lambert93(lat:np.ndarray, lon:np.ndarray) -> tuple:
+    """Vectorized projection of degrees into Lambert-93 meters (x, y)"""
+    e, n, c = LAMBERT93['e'], LAMBERT93['n'], LAMBERT93['c']
+    lat, gamma = np.radians(lat), n * np.radians(lon - LAMBERT93['lon0'])
+    # Latitude isométrique
+    isometric = np.log(np.tan(np.pi / 4 + lat / 2) * ((1 - e * np.sin(lat)) / (1 + e * np.sin(lat))) ** (e / 2))
+    radius = c * np.exp(-n * isometric)
+    return LAMBERT93['xs'] + radius * np.sin(gamma), LAMBERT93['ys'] - radius * np.cos(gamma)
+
+
 # Define a framing function
-def frame_data(df: pd.DataFrame) -> pd.DataFrame:
-    """ One function all framing (column renaming, column merge)"""
-    # Concaténer les colonnes en tenant compte des valeurs vides
-    df['address'] = df['adr_num'].fillna('') + " " + df['adr_voie'].fillna('') + " " + df['com_cp'].fillna('') + " " + df['com_nom'].fillna('')
-    df['address'] = df['address'].str.strip()
-    df['address'] = df['address'].str.replace(r'\s+', ' ', regex=True)
-    # Vérifier si adr_voie est vide et remplacer l'adresse par pd.NA
-    df.loc[df['adr_voie'].isna() | (df['adr_voie'] == ''), 'address'] = pd.NA
+@_stage
+def frame_data(df: pd.DataFrame, copy:bool=True, categorical:bool=False,
+               postal_codes:bool=False) -> pd.DataFrame:
+    """ One function all framing (column renaming, column merge)
+
+    With copy=False df is modified in place, otherwise it is left untouched.
+    With categorical=True address and freq_mnt are returned as category.
+    With postal_codes=True com_cp is kept after the address (see lookup.LookupIndex).
+    """
+    if copy:
+        df = df.copy()
+    # L'adresse n'est construite qu'une fois par combinaison distincte des
+    # colonnes (codes de groupe), puis reportée sur les lignes
+    parts = list(ADDRESS_COLUMNS)
+    codes = df.groupby(parts, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+    addresses = _build_addresses(df[parts].drop_duplicates())
+    address_codes, unique_addresses = pd.factorize(addresses.array)
+    address = pd.Categorical.from_codes(address_codes[codes], categories=unique_addresses)
     # Supprimer les colonnes obsolètes
-    df.drop(['adr_num', 'adr_voie', 'com_cp', 'com_nom'], axis=1, inplace=True)
+    df.drop([part for part in parts if not (postal_codes and part == 'com_cp')], axis=1, inplace=True)
     # Insérer la colonne "address" en deuxième position
-    df.insert(1, 'address', df.pop('address'))
+    df.insert(1, 'address', pd.Series(address, index=df.index))
 
-    df = df.astype({
+    dtypes = {
     'nom': 'string',
-    'address': 'string',
+    'address': addresses.dtype,
     'tel1': 'string',
     'freq_mnt': 'string',
+}
+    if categorical:
+        del dtypes['address']
+        df['freq_mnt'] = df['freq_mnt'].astype('category')
+        del dtypes['freq_mnt']
+    return _ensure_dtypes(df, dtypes)
 
-})
-    df['dermnt'] = pd.to_datetime(df['dermnt'], errors='coerce')
-    # for column in df.columns:
-    #     print(f"{column}: {df[column].dtype}")
 
-    return df
+def _build_addresses(parts:pd.DataFrame) -> pd.Series:
+    """Join the address columns into one address, pd.NA when adr_voie is missing"""
+    parts = parts.astype(parts['adr_voie'].dtype)
+    # Concaténer les colonnes en tenant compte des valeurs vides
+    address = parts['adr_num'].fillna('') + " " + parts['adr_voie'].fillna('') + " " + parts['com_cp'].fillna('') + " " + parts['com_nom'].fillna('')
+    address = address.str.strip()
+    address = address.str.replace(r'\s+', ' ', regex=True)
+    # Vérifier si adr_voie est vide et remplacer l'adresse par pd.NA
+    return address.mask(parts['adr_voie'].isna() | (parts['adr_voie'] == ''))
 
 # once they are all done, call them in the general clean loading function
-def load_clean_data(data_path:str=DATA_PATH)-> pd.DataFrame:
-    """one function to run it all and return a clean dataframe"""
-    df = (load_formatted_data(data_path)
-          .pipe(sanitize_data)
-          .pipe(frame_data)
-    )
-    print(df)
+def load_clean_data(data_path:str=DATA_PATH, chunksize:int=None, workers:int=None,
+                    cache_dir:str=None, fingerprint:str='mtime', verbose:bool=False,
+                    string_storage:str=None, categorical:bool=False,
+                    coordinates:bool=False, extra_dates:bool=False,
+                    address_numbers:bool=False, postal_codes:bool=False,
+                    shared_path:str=None)-> pd.DataFrame:
+    """one function to run it all and return a clean dataframe
+
+    With workers, the rows (or the chunks when chunksize is given) are
+    cleaned in a pool of processes and put back in their original order.
+    With cache_dir, the clean frame is stored as parquet, keyed by the source
+    file fingerprint ('mtime': size + mtime, 'content': sha256) and the
+    cleaning rules, and read back as long as neither changes.
+    With string_storage='pyarrow', the text columns are string[pyarrow] from
+    the read to the output.
+    With categorical=True, address and freq_mnt are returned as category.
+    With coordinates=True, swapped coordinates are fixed and flagged (see
+    sanitize_coordinates).
+    With extra_dates=True, the EXTRA_DATE_COLUMNS are loaded as dates too.
+    With address_numbers=True, the address numbers are also returned as
+    ADDRESS_NUMBER_COLUMNS (integer start and end, suffix).
+    With postal_codes=True, the sanitized com_cp is kept next to the address.
+    With shared_path, the clean frame is published there as a memory-mapped
+    snapshot (see publish_shared_frame) and returned mapped from it: the
+    processes loading the same data share one copy, and load it without
+    cleaning as long as the source and the rules are unchanged.
+    """
+    options = {'categorical': categorical, 'coordinates': coordinates, 'extra_dates': extra_dates,
+               'address_numbers': address_numbers, 'postal_codes': postal_codes}
+    key = _cache_key(data_path, fingerprint, **options) if shared_path is not None else None
+    cache_path = _cache_path(data_path, cache_dir, fingerprint, **options) if cache_dir is not None else None
+    df = _read_stored(shared_path, key, cache_path, string_storage)
+    if df is None:
+        df = _clean_data(data_path, chunksize, workers, verbose, string_storage, **options)
+        if cache_path is not None:
+            _write_cache(df, cache_path)
+        if shared_path is not None:
+            publish_shared_frame(df, shared_path, key=key)
+            df = open_shared_frame(shared_path)
+    if verbose:
+        print(df)
+    return df
+
+
+def _read_stored(shared_path:str, key:str, cache_path:str, string_storage:str=None) -> pd.DataFrame:
+    """The clean frame from the shared snapshot or the parquet cache, None when neither is current"""
+    if shared_path is not None and _shared_frame_key(shared_path) == key:
+        return open_shared_frame(shared_path)
+    if cache_path is not None and os.path.exists(cache_path):
+        with pd.option_context('mode.string_storage', string_storage or pd.get_option('mode.string_storage')):
+            return _string_categories(pd.read_parquet(cache_path), string_storage)
+    return None
+
+
+def _clean_data(data_path:str, chunksize:int=None, workers:int=None, verbose:bool=False,
+                string_storage:str=None, categorical:bool=False, coordinates:bool=False,
+                extra_dates:bool=False, address_numbers:bool=False, postal_codes:bool=False) -> pd.DataFrame:
+    """Clean data_path in one pass, or by chunks and/or in processes (see load_clean_data)"""
+    if chunksize is None and not workers:
+        return (load_formatted_data(data_path, verbose=verbose, string_storage=string_storage,
+                                    extra_dates=extra_dates)
+                .pipe(sanitize_data, copy=False, categorical=categorical, coordinates=coordinates,
+                      address_numbers=address_numbers)
+                .pipe(frame_data, copy=False, categorical=categorical, postal_codes=postal_codes)
+        )
+
+    chunks = _read_columns(data_path, chunksize=chunksize, columns=_columns(extra_dates),
+                           string_storage=string_storage)
+    if chunksize is None:
+        chunks = _split_rows(next(chunks), workers)
+    clean_chunk = functools.partial(_clean_chunk, categorical=categorical, coordinates=coordinates,
+                                    address_numbers=address_numbers, postal_codes=postal_codes)
+    if workers:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            df = _concat_chunks(list(pool.map(clean_chunk, chunks)))
+    else:
+        df = _concat_chunks(list(map(clean_chunk, chunks)))
+    if coordinates:
+        # Un même point peut se trouver dans deux morceaux
+        _flag_duplicate_coordinates(df)
     return df
 
 
+def _cache_path(data_path:str, cache_dir:str, fingerprint:str='mtime', **options) -> str:
+    """Path of the cached clean frame for the current state of data_path and of the rules.
+
+    The name is <file name>-<slot>-<key>: the slot identifies the source path
+    and the load options, only the previous caches of the same slot are
+    replaced (see _write_cache).
+    """
+    name = os.path.splitext(os.path.basename(data_path))[0]
+    slot = hashlib.sha256(repr((os.path.abspath(data_path), fingerprint, sorted(options.items()))).encode())
+    key = _cache_key(data_path, fingerprint, **options)
+    return os.path.join(cache_dir, f'{name}-{slot.hexdigest()[:8]}-{key[:16]}.parquet')
+
+
+def _cache_key(data_path:str, fingerprint:str='mtime', categorical:bool=False, coordinates:bool=False,
+               extra_dates:bool=False, address_numbers:bool=False, postal_codes:bool=False) -> str:
+    """Hash of the current state of data_path, of the rules and of the load options"""
+    key = hashlib.sha256()
+    if fingerprint == 'content':
+        with open(data_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                key.update(block)
+    elif fingerprint == 'mtime':
+        stat = os.stat(data_path)
+        key.update(f'{os.path.abspath(data_path)}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    else:
+        raise ValueError(f"fingerprint should be 'mtime' or 'content', not {fingerprint!r}")
+    key.update(_rules_fingerprint().encode())
+    key.update(b'categorical' if categorical else b'')
+    key.update(b'coordinates' if coordinates else b'')
+    key.update(b'extra_dates' if extra_dates else b'')
+    key.update(b'address_numbers' if address_numbers else b'')
+    key.update(b'postal_codes' if postal_codes else b'')
+    return key.hexdigest()
+
+
+def _rules_fingerprint() -> str:
+    """Hash of everything the clean output depends on, besides the source file"""
+    rules = (CLEANING_VERSION, COLUMNS, NA_VALUES, COLUMN_NA_VALUES, DATE_COLUMNS,
+             EXTRA_DATE_COLUMNS, DATE_FORMATS, TEL_PREFIXES, TEL_SEPARATOR,
+             STREET_TYPES, STREET_PARTICLES, STREET_ELISIONS, STREET_NOISE,
+             ADDRESS_NUMBER_PATTERN, STREET_NUMBER_PATTERN, COORDINATE_COLUMNS, COORDINATE_BBOX)
+    key = hashlib.sha256(repr(rules).encode())
+    # Modifier les corrections manuelles invalide aussi les caches
+    if os.path.exists(CORRECTIONS_PATH):
+        with open(CORRECTIONS_PATH, 'rb') as f:
+            key.update(f.read())
+    return key.hexdigest()
+
+
+def _write_cache(df:pd.DataFrame, cache_path:str, prune:bool=True):
+    cache_dir, cache_name = os.path.split(cache_path)
+    os.makedirs(cache_dir or '.', exist_ok=True)
+    # Écriture dans un fichier temporaire renommé ensuite : un lecteur ne voit
+    # jamais un cache à moitié écrit
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, cache_path)
+    if not prune:
+        return
+
+    # Supprimer les caches obsolètes du même fichier source chargé avec les
+    # mêmes options (même préfixe <nom>-<slot>-, voir _cache_path)
+    prefix = cache_name.rsplit('-', 1)[0] + '-'
+    for name in os.listdir(cache_dir or '.'):
+        if name.startswith(prefix) and name.endswith('.parquet') and name != cache_name:
+            os.remove(os.path.join(cache_dir, name))
+
+
+def update_clean_data(data_path:str, snapshot_path:str, key:list=None) -> tuple:
+    """Clean only the rows of data_path that are new or changed since the last snapshot.
+
+    Rows are identified by the key columns, or by a hash of the whole row when
+    key is None (the export's id/ref columns are not unique). Unchanged rows
+    are taken from the snapshot at snapshot_path, which is then replaced by
+    the new result. Returns the clean frame and a report: row labels of the
+    'added' and 'changed' rows, and the previous clean rows 'deleted'.
+    """
+    key = list(key or [])
+    columns = {**{column: 'string' for column in key}, **COLUMNS}
+    raw = next(_read_columns(data_path, columns=columns))
+    row_hash = _hash_rows(raw)
+    if key:
+        row_key = pd.util.hash_pandas_object(raw[key], index=False)
+        if row_key.duplicated().any():
+            raise ValueError(f'The key {key} does not identify the rows of {data_path}')
+        raw = raw[list(COLUMNS)]
+    else:
+        # Des lignes identiques sont distinguées par leur rang d'apparition
+        row_key = pd.util.hash_pandas_object(
+            pd.DataFrame({'hash': row_hash, 'rank': row_hash.groupby(row_hash).cumcount()}), index=False)
+
+    previous = None
+    if os.path.exists(snapshot_path):
+        previous = pd.read_parquet(snapshot_path)
+        # Des règles de nettoyage différentes rendent le snapshot inutilisable
+        if previous.attrs.get('rules') != _rules_fingerprint() or previous.attrs.get('key') != key:
+            previous = None
+
+    if previous is None:
+        previous = pd.DataFrame({'_key': pd.Series(dtype='uint64'), '_row_hash': pd.Series(dtype='uint64')})
+    previous_hash = pd.Series(previous['_row_hash'].to_numpy(), index=previous['_key'].to_numpy())
+    matched_hash = row_key.map(previous_hash)
+    added = matched_hash.isna()
+    unchanged = matched_hash == row_hash
+    changed = ~added & ~unchanged
+
+    # Seules les lignes nouvelles ou modifiées passent par le nettoyage
+    cleaned = _clean_chunk(raw[~unchanged].copy())
+    reused = previous.set_index('_key').loc[row_key[unchanged].to_numpy()]
+    reused.index = raw.index[unchanged]
+    reused = reused.drop(columns='_row_hash')
+    df = pd.concat([reused, cleaned]).sort_index() if len(reused) else cleaned
+
+    deleted = previous[~previous['_key'].isin(row_key)].drop(columns=['_key', '_row_hash'])
+
+    snapshot = df.assign(_key=row_key, _row_hash=row_hash)
+    snapshot.attrs = {'rules': _rules_fingerprint(), 'key': key}
+    _write_cache(snapshot, snapshot_path, prune=False)
+
+    report = {'added': raw.index[added.to_numpy()], 'changed': raw.index[changed.to_numpy()], 'deleted': deleted}
+    return df, report
+
+
+def publish_shared_frame(df:pd.DataFrame, shared_path:str, key:str=None):
+    """Write df to shared_path as an uncompressed Arrow IPC file, for open_shared_frame.
+
+    The file is written next to shared_path then renamed over it: readers
+    see the previous snapshot or the new one, never a partial file, and the
+    previous one stays valid for the processes still mapping it (POSIX).
+    key is stored in the file, to know which data it holds.
+    """
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'loader.key': (key or '').encode()})
+    os.makedirs(os.path.dirname(shared_path) or '.', exist_ok=True)
+    tmp_path = f'{shared_path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, shared_path)
+
+
+def open_shared_frame(shared_path:str) -> pd.DataFrame:
+    """Map the frame published at shared_path, read-only.
+
+    The text columns are string[pyarrow] reading the mapped file without
+    copy, the pages are shared by all the processes mapping it. The other
+    columns (numbers with NaN, dates, category codes, flags) are small and
+    converted to their usual pandas dtype.
+    """
+    import pyarrow as pa
+    table = pa.ipc.open_file(pa.memory_map(str(shared_path), 'r')).read_all()
+    df = table.to_pandas(types_mapper=_shared_dtype, split_blocks=True)
+    return _string_categories(df, 'pyarrow')
+
+
+def _string_categories(df:pd.DataFrame, string_storage:str=None) -> pd.DataFrame:
+    """Categories read back as object (parquet, Arrow) turned back into strings, as load_clean_data returns them"""
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and df[column].cat.categories.dtype == object:
+            categories = df[column].cat.categories.astype(pd.StringDtype(string_storage))
+            df[column] = df[column].cat.rename_categories(categories)
+    return df
+
+
+def _shared_dtype(arrow_type):
+    import pyarrow as pa
+    if pa.types.is_string(arrow_type):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+def _shared_frame_key(shared_path:str) -> str:
+    """Key stored by publish_shared_frame, None without a (readable) snapshot"""
+    import pyarrow as pa
+    try:
+        metadata = pa.ipc.open_file(pa.memory_map(str(shared_path), 'r')).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    return metadata.get(b'loader.key', b'').decode() or None
+
+
+class SharedFrame:
+    """Clean frame mapped from shared_path, following the snapshots published there.
+
+    frame() checks the file on each call (one stat) and maps it again when
+    a new snapshot replaced it. A frame already returned keeps reading its
+    own snapshot, so a request is never served half old, half new data.
+    """
+
+    def __init__(self, shared_path:str):
+        self.shared_path = shared_path
+        self._stat = None
+        self._frame = None
+
+    def frame(self) -> pd.DataFrame:
+        stat = os.stat(self.shared_path)
+        stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if stat != self._stat:
+            # Relevé avant de mapper : un remplacement entre les deux sera vu au prochain appel
+            self._frame = open_shared_frame(self.shared_path)
+            self._stat = stat
+        return self._frame
+
+
+def iter_clean_data(data_path:str=DATA_PATH, chunksize:int=100_000, engine:str=None,
+                    string_storage:str=None, extra_dates:bool=False):
+    """Yield the clean data chunk by chunk, memory stays bounded by chunksize (not with engine='pyarrow')"""
+    for chunk in _read_columns(data_path, engine=engine, chunksize=chunksize, columns=_columns(extra_dates),
+                               string_storage=string_storage):
+        yield _clean_chunk(chunk)
+
+
+def _clean_chunk(chunk:pd.DataFrame, categorical:bool=False, coordinates:bool=False,
+                 address_numbers:bool=False, postal_codes:bool=False) -> pd.DataFrame:
+    return (format_data(chunk)
+            .pipe(sanitize_data, copy=False, categorical=categorical, coordinates=coordinates,
+                  address_numbers=address_numbers)
+            .pipe(frame_data, copy=False, categorical=categorical, postal_codes=postal_codes)
+    )
+
+
+def _concat_chunks(chunks:list) -> pd.DataFrame:
+    """Concatenate clean chunks, merging the categories of their category columns"""
+    # Catégories fusionnées avant la concaténation : avec les mêmes catégories,
+    # pd.concat garde le type category sans passer par object
+    categories = {column: union_categoricals([chunk[column] for chunk in chunks]).categories
+                  for column, dtype in chunks[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)}
+    if categories:
+        chunks = [chunk.assign(**{column: chunk[column].cat.set_categories(merged)
+                                  for column, merged in categories.items()})
+                  for chunk in chunks]
+    return pd.concat(chunks)
+
+
+def _split_rows(df:pd.DataFrame, parts:int) -> list:
+    """Split df in (at most) parts consecutive, non empty partitions"""
+    bounds = np.linspace(0, len(df), parts + 1).astype(int)
+    partitions = [df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+    return partitions or [df]
+
+
+def write_clean_data(data_path:str, output, chunksize:int=100_000, engine:str=None,
+                     string_storage:str=None) -> int:
+    """Clean data_path chunk by chunk into a csv output (path or buffer), return the row count"""
+    rows = 0
+    chunks = iter_clean_data(data_path, chunksize=chunksize, engine=engine, string_storage=string_storage)
+    for position, chunk in enumerate(chunks):
+        # L'en-tête n'est écrit qu'avec le premier morceau
+        chunk.to_csv(output, mode='a' if position else 'w', header=not position, index=False)
+        rows += len(chunk)
+    return rows
+
+
+def scan_clean_data(data_path:str=DATA_PATH, chunksize:int=None, string_storage:str=None,
+                    categorical:bool=False, coordinates:bool=False, extra_dates:bool=False,
+                    address_numbers:bool=False, postal_codes:bool=False) -> 'CleanPlan':
+    """Lazy counterpart of load_clean_data: nothing is read until collect() is called on the plan"""
+    return CleanPlan(data_path, chunksize=chunksize, string_storage=string_storage, categorical=categorical,
+                     coordinates=coordinates, extra_dates=extra_dates, address_numbers=address_numbers,
+                     postal_codes=postal_codes)
+
+
+class CleanPlan:
+    """Lazy, declarative plan of the cleaning of a csv (see scan_clean_data).
+
+    The plan records the output columns and the string transforms of each
+    column, collect() runs them:
+    - only the export columns the selected output depends on are read,
+    - the transforms of a column (its cleaning, then the transform() calls)
+      are fused into a single pass over its distinct values,
+    - the address parts are cleaned and joined once per distinct combination
+      of raw parts, instead of being cleaned on every row then dropped.
+    collect() returns the frame of load_clean_data, restricted to the
+    selected columns. select() and transform() return a new plan.
+    """
+
+    def __init__(self, data_path:str=DATA_PATH, chunksize:int=None, string_storage:str=None,
+                 categorical:bool=False, coordinates:bool=False, extra_dates:bool=False,
+                 address_numbers:bool=False, postal_codes:bool=False, columns:tuple=None,
+                 transforms:tuple=()):
+        self.data_path = data_path
+        self.chunksize = chunksize
+        self.string_storage = string_storage
+        self.categorical = categorical
+        self.coordinates = coordinates
+        self.extra_dates = extra_dates
+        self.address_numbers = address_numbers
+        self.postal_codes = postal_codes
+        outputs = self._outputs()
+        self.columns = tuple(outputs if columns is None else columns)
+        unknown = [column for column in self.columns if column not in outputs]
+        if unknown:
+            raise ValueError(f'Unknown output columns {unknown}, expected some of {list(outputs)}')
+        # Transformations ajoutées par transform() : (colonne, fonction), dans l'ordre
+        self.transforms = tuple(transforms)
+
+    def select(self, *columns:str) -> 'CleanPlan':
+        """Plan restricted to the given output columns, in this order"""
+        return self._replace(columns=columns)
+
+    def transform(self, column:str, transform) -> 'CleanPlan':
+        """Plan running transform (Series -> Series of strings) after the cleaning of column.
+
+        column is a text output column (nom, address, tel1, freq_mnt) or an
+        address part, the transform then applies before the parts are joined.
+        """
+        text_columns = [name for name, dtype in COLUMNS.items() if dtype == 'string' and name not in DATE_COLUMNS]
+        if column not in text_columns + ['address']:
+            raise ValueError(f'{column!r} is not a text column: {text_columns + ["address"]}')
+        return self._replace(transforms=self.transforms + ((column, transform),))
+
+    @property
+    def source_columns(self) -> list:
+        """Columns of the export read by collect()"""
+        outputs = self._outputs()
+        sources = {source for column in self.columns for source in outputs[column]}
+        if self._corrected(sources):
+            # Les corrections sont associées au hash de toutes les COLUMNS de la ligne
+            sources.update(COLUMNS)
+        return [column for column in _columns(self.extra_dates) if column in sources]
+
+    def explain(self) -> str:
+        """Description of the steps run by collect(), one line per step"""
+        sources = self.source_columns
+        lines = [f"read {', '.join(sources)}"]
+        if self._corrected(sources):
+            lines.append('apply_corrections')
+        if self.coordinates and set(COORDINATE_COLUMNS) <= set(sources):
+            lines.append('sanitize_coordinates')
+        for column in self.columns:
+            if column == 'address':
+                parts = [f'{part}: {self._describe(part)}' for part in ADDRESS_COLUMNS]
+                steps = f"per distinct ({', '.join(parts)}) -> _build_addresses"
+                if self._fused('address')[1] is not None:
+                    steps += f" -> {self._describe('address')}"
+            elif column in DATE_COLUMNS + EXTRA_DATE_COLUMNS:
+                steps = 'parse_dates'
+            else:
+                steps = self._describe(column)
+            lines.append(f'{column}: {steps}')
+        return '\n'.join(lines)
+
+    def collect(self) -> pd.DataFrame:
+        """Run the plan and return the clean frame"""
+        columns = _columns(self.extra_dates)
+        chunks = _read_columns(self.data_path, chunksize=self.chunksize, string_storage=self.string_storage,
+                               columns={column: columns[column] for column in self.source_columns})
+        df = _concat_chunks([self._collect_chunk(chunk) for chunk in chunks])
+        if COORDINATE_FLAGS[2] in self.columns:
+            # Doublons comparés sur tout le fichier, puis coordonnées non sélectionnées retirées
+            _flag_duplicate_coordinates(df)
+            df = df[list(self.columns)]
+        return df
+
+    def _collect_chunk(self, chunk:pd.DataFrame) -> pd.DataFrame:
+        chunk = self._prepare_chunk(chunk)
+        numbers = None
+        if any(column in ADDRESS_NUMBER_COLUMNS for column in self.columns):
+            numbers = _parse_address_numbers(chunk['adr_num'], chunk['adr_voie'])
+
+        df = pd.DataFrame(index=chunk.index)
+        for column in self.columns:
+            df[column] = self._collect_column(chunk, column, numbers)
+        if COORDINATE_FLAGS[2] in self.columns:
+            # Gardées jusqu'à collect(), qui compare les points de tous les morceaux
+            for column in COORDINATE_COLUMNS:
+                if column not in df.columns:
+                    df[column] = chunk[column]
+        for column in ('freq_mnt', 'com_cp'):
+            if self.categorical and column in df.columns:
+                df[column] = df[column].astype('category')
+        return df
+
+    def _prepare_chunk(self, chunk:pd.DataFrame) -> pd.DataFrame:
+        """Steps run on the read rows before the cleaning of the columns"""
+        if self._corrected(chunk.columns):
+            chunk = apply_corrections(chunk)
+        if self.coordinates and set(COORDINATE_COLUMNS) <= set(chunk.columns):
+            chunk = sanitize_coordinates(chunk)
+        dates = [column for column in self.columns if column in DATE_COLUMNS + EXTRA_DATE_COLUMNS]
+        if dates:
+            chunk = parse_dates(chunk, columns=dates)
+        return chunk
+
+    def _collect_column(self, chunk:pd.DataFrame, column:str, numbers:pd.DataFrame) -> pd.Series:
+        namespace, transform = self._fused(column)
+        if column == 'address':
+            return self._address(chunk)
+        if column in ADDRESS_NUMBER_COLUMNS:
+            return numbers[column]
+        if transform is not None:
+            return clean_uniques(chunk[column], transform, namespace=namespace)
+        return chunk[column]
+
+    def _address(self, chunk:pd.DataFrame) -> pd.Series:
+        # Les parties sont nettoyées puis jointes une fois par combinaison
+        # distincte des valeurs brutes (codes de groupe), comme dans frame_data
+        parts = list(ADDRESS_COLUMNS)
+        codes = chunk.groupby(parts, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+        combinations = chunk[parts].drop_duplicates()
+        # Le numéro est lu avant le nettoyage de la voie, qui peut le contenir
+        numbers = _parse_address_numbers(combinations['adr_num'], combinations['adr_voie'])
+        combinations[['adr_num', 'adr_voie']] = numbers[['adr_num', 'adr_voie']]
+        for part in parts:
+            namespace, transform = self._fused(part)
+            if transform is not None:
+                combinations[part] = clean_uniques(combinations[part], transform, namespace=namespace)
+        addresses = _build_addresses(combinations)
+        namespace, transform = self._fused('address')
+        if transform is not None:
+            addresses = clean_uniques(addresses, transform, namespace=namespace)
+
+        address_codes, unique_addresses = pd.factorize(addresses.array)
+        address = pd.Series(pd.Categorical.from_codes(address_codes[codes], categories=unique_addresses),
+                            index=chunk.index)
+        return address if self.categorical else address.astype(addresses.dtype)
+
+    def _fused(self, column:str) -> tuple:
+        """(cache namespace, transform) of column: its cleaning then the transform() calls as one function"""
+        namespace, cleaning = _column_transforms().get(column, ((column,), None))
+        added = tuple(transform for name, transform in self.transforms if name == column)
+        transforms = ([cleaning] if cleaning is not None else []) + list(added)
+        if added:
+            namespace = namespace + ('transform',) + added
+        if len(transforms) <= 1:
+            return namespace, (transforms or [None])[0]
+
+        def fused(values:pd.Series) -> pd.Series:
+            for transform in transforms:
+                values = transform(values)
+            return values
+        return namespace, fused
+
+    def _describe(self, column:str) -> str:
+        _, cleaning = _column_transforms().get(column, ((column,), None))
+        if column == 'adr_num':
+            # Numéro lu avec la voie, par _address
+            cleaning = _parse_address_numbers
+        transforms = ([cleaning] if cleaning is not None else []) + [
+            transform for name, transform in self.transforms if name == column]
+        names = [getattr(transform, '__name__', None) or getattr(transform, 'func', transform).__name__
+                 for transform in transforms]
+        return ' + '.join(names) + ' (fused)' if len(names) > 1 else (names or ['as read'])[0]
+
+    def _corrected(self, sources) -> bool:
+        return any(column in sources for column in _corrections(CORRECTIONS_PATH))
+
+    def _outputs(self) -> dict:
+        outputs = dict(OUTPUT_COLUMNS)
+        if self.postal_codes:
+            # Juste après l'adresse, comme dans frame_data
+            names = list(outputs)
+            names.insert(names.index('address') + 1, 'com_cp')
+            outputs = {name: outputs.get(name, ('com_cp',)) for name in names}
+        if self.extra_dates:
+            outputs.update({column: (column,) for column in EXTRA_DATE_COLUMNS})
+        if self.address_numbers:
+            outputs.update({column: ('adr_num', 'adr_voie') for column in ADDRESS_NUMBER_COLUMNS})
+        if self.coordinates:
+            # Une position est contrôlée avec ses deux coordonnées
+            outputs.update({column: COORDINATE_COLUMNS for column in COORDINATE_COLUMNS + COORDINATE_FLAGS})
+        return outputs
+
+    def _replace(self, **changes) -> 'CleanPlan':
+        return CleanPlan(**{**vars(self), **changes})
+
+
+def _column_transforms() -> dict:
+    """Cleaning of each text column, as (cache namespace, transform) shared with the sanitizers"""
+    return _build_column_transforms(tuple(TEL_PREFIXES.values()), TEL_SEPARATOR, _street_rule_table())
+
+
+@functools.lru_cache(maxsize=None)
+def _build_column_transforms(prefixes:tuple, separator:str, street_rules:tuple) -> dict:
+    # Construit une fois par jeu de règles, comme _tel_pattern et _street_rules
+    return {
+        'tel1': (('tel1', prefixes, separator), functools.partial(_format_tel, prefixes=prefixes,
+                                                                   separator=separator)),
+        'adr_voie': (('adr_voie',) + street_rules, functools.partial(_clean_adr_voie, rules=street_rules)),
+        'com_cp': (('com_cp',), _drop_zero_cp),
+        'com_nom': (('com_nom',), _fill_city),
+        'freq_mnt': (('freq_mnt',), _fill_frequency),
+    }
+
+
+def clean_files(sources:list, output_dir:str=None, output_format:str='csv', workers:int=None,
+                download_workers:int=DOWNLOAD_WORKERS, chunksize:int=None, data_dir:str='data',
+                fail_fast:bool=False) -> list:
+    """Download (urls) and clean many files concurrently, return one result dict per source.
+
+    Downloads run in a pool of threads, each file is cleaned in a pool of
+    processes as soon as it is available and written to output_dir in
+    output_format, or returned as the result's frame without output_dir.
+    A result has: source, rows, bytes (of the csv), download_time and
+    clean_time (seconds), output, frame and error (None on success).
+    With fail_fast, the first error cancels the work not started yet.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'output_format should be one of {list(OUTPUT_FORMATS)}, not {output_format!r}')
+    outputs = _output_paths(sources, output_dir, output_format)
+    download_dirs = _download_dirs(sources, data_dir)
+
+    results = [{'source': source, 'rows': None, 'bytes': None, 'download_time': None, 'clean_time': None,
+                'output': None, 'frame': None, 'error': None} for source in sources]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers) as cleaning:
+        def clean(position, data_path):
+            return cleaning.submit(_clean_file, data_path, outputs[position], output_format, chunksize)
+
+        # Étape en cours de chaque source : téléchargement ou nettoyage
+        pending = {}
+        for position, source in enumerate(sources):
+            if source.startswith(('http://', 'https://')):
+                pending[downloads.submit(_download_file, source, download_dirs[source])] = position
+            else:
+                pending[clean(position, source)] = position
+
+        stopped = False
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                position = pending.pop(future)
+                data_path = _record_result(future, results[position])
+                if fail_fast and not stopped and results[position]['error'] is not None:
+                    stopped = True
+                    _cancel_pending(pending, results)
+                elif data_path is not None and stopped:
+                    results[position]['error'] = 'cancelled'
+                elif data_path is not None:
+                    # Téléchargé : le nettoyage commence sans attendre les autres fichiers
+                    pending[clean(position, data_path)] = position
+    return results
+
+
+def _output_paths(sources:list, output_dir:str, output_format:str) -> list:
+    """Output file of each source in output_dir, named after it (None without output_dir)"""
+    if output_dir is None:
+        return [None] * len(sources)
+    names = [os.path.splitext(os.path.basename(source.split('?')[0]))[0] + OUTPUT_FORMATS[output_format]
+             for source in sources]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f'Several sources would be written to {duplicated} in {output_dir}')
+    os.makedirs(output_dir, exist_ok=True)
+    return [os.path.join(output_dir, name) for name in names]
+
+
+def _record_result(future:concurrent.futures.Future, result:dict) -> str:
+    """Store the measures or the error of a finished step in result, return the downloaded path if any"""
+    try:
+        measures = future.result()
+    except Exception as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+        return None
+    data_path = measures.pop('data_path', None)
+    result.update(measures)
+    return data_path
+
+
+def _cancel_pending(pending:dict, results:list):
+    """Cancel the steps not started yet (fail_fast): the running ones finish"""
+    for future in list(pending):
+        if future.cancel():
+            results[pending.pop(future)]['error'] = 'cancelled'
+
+
+def _download_dirs(sources:list, data_dir:str) -> dict:
+    """Directory each url is downloaded to: data_dir, or its own subdirectory
+    when several urls end with the same file name ('.../exports/csv')"""
+    urls = [source for source in sources if source.startswith(('http://', 'https://'))]
+    duplicated = sorted(url for url, count in collections.Counter(urls).items() if count > 1)
+    if duplicated:
+        raise ValueError(f'Urls given several times: {duplicated}')
+    names = collections.Counter(os.path.basename(url.split('?')[0]) for url in urls)
+    return {url: data_dir if names[os.path.basename(url.split('?')[0])] == 1
+            else os.path.join(data_dir, hashlib.sha256(url.encode()).hexdigest()[:16])
+            for url in urls}
+
+
+def _download_file(url:str, data_dir:str) -> dict:
+    start = time.perf_counter()
+    data_path = download_data(url, data_dir=data_dir)
+    return {'data_path': data_path, 'download_time': time.perf_counter() - start}
+
+
+def _clean_file(data_path:str, output:str, output_format:str, chunksize:int=None) -> dict:
+    """Clean data_path in a worker process, write it to output (or return the frame without output)"""
+    start = time.perf_counter()
+    df = load_clean_data(data_path, chunksize=chunksize)
+    if output is not None:
+        _write_output(df, output, output_format)
+    return {'rows': len(df), 'bytes': os.path.getsize(data_path), 'clean_time': time.perf_counter() - start,
+            'output': output, 'frame': None if output is not None else df}
+
+
+def _write_output(df:pd.DataFrame, output:str, output_format:str):
+    # Fichier temporaire renommé ensuite, comme pour le cache
+    tmp_path = f'{output}.{os.getpid()}.tmp'
+    if output_format == 'csv':
+        df.to_csv(tmp_path, index=False)
+    elif output_format == 'parquet':
+        df.to_parquet(tmp_path)
+    else:
+        df.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, output)
+
+
+def _format_summary(results:list, wall_time:float) -> str:
+    lines = []
+    for result in results:
+        if result['error']:
+            lines.append(f"{result['source']}  failed: {result['error']}")
+        else:
+            download = f"download {result['download_time']:.2f}s  " if result['download_time'] is not None else ''
+            lines.append(f"{result['source']}  {result['rows']} rows  {download}clean {result['clean_time']:.2f}s"
+                         f"{'  -> ' + result['output'] if result['output'] else ''}")
+    cleaned = [result for result in results if not result['error']]
+    rows = sum(result['rows'] for result in cleaned)
+    size = sum(result['bytes'] for result in cleaned)
+    lines.append(f'{len(cleaned)}/{len(results)} files  {rows} rows in {wall_time:.2f}s  '
+                 f'{rows / wall_time:.0f} rows/s  {size / wall_time / 1e6:.1f} MB/s')
+    return '\n'.join(lines)
+
+
+def main(argv:list=None) -> int:
+    """Command line cleaning many csv paths or urls concurrently, see python loader.py --help"""
+    # Importé ici : seule la ligne de commande en a besoin
+    import argparse
+    parser = argparse.ArgumentParser(description='Download and clean defibrillator exports')
+    parser.add_argument('sources', nargs='*', default=[DATA_PATH], help='csv paths or urls to clean')
+    parser.add_argument('-o', '--output-dir', help='where the clean files are written (printed otherwise)')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default='csv', help='format of the clean files')
+    parser.add_argument('--workers', type=int, help='processes cleaning the files (cpu count by default)')
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS, help='concurrent downloads')
+    parser.add_argument('--chunksize', type=int, help='clean each file by chunks of this many rows')
+    parser.add_argument('--data-dir', default='data', help='where the downloaded files are kept')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='stop at the first failure instead of cleaning the other files')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = clean_files(args.sources, output_dir=args.output_dir, output_format=args.format,
+                          workers=args.workers, download_workers=args.download_workers,
+                          chunksize=args.chunksize, data_dir=args.data_dir, fail_fast=args.fail_fast)
+    for result in results:
+        if result['frame'] is not None:
+            print(result['frame'])
+    print(_format_summary(results, time.perf_counter() - start))
+    return 1 if any(result['error'] for result in results) else 0
+
+
 # if the module is called, run the main loading function
 if __name__ == '__main__':
-    df = load_clean_data()
+    sys.exit(main())
@@ -1,3 +1,6 @@
+import json
+import os
+
 import pytest
 import numpy as np
 import pandas as pd
@@ -464,6 +467,14 @@ def test_sanitize_data(sample_formatted, sample_sanitized):
     assert sanitize_data(sample_formatted).equals(sample_sanitized)
 
 
+def test_sanitize_data_non_range_index(sample_formatted, sample_sanitized):
+    from loader import sanitize_data
+    shifted_index = pd.Index(range(100, 100 + len(sample_formatted)))
+    sample_formatted.index = shifted_index
+    sample_sanitized.index = shifted_index
+    assert sanitize_data(sample_formatted).equals(sample_sanitized)
+
+
 def test_frame_data(sample_sanitized, sample_framed):
     from loader import frame_data
     assert frame_data(sample_sanitized).equals(sample_framed)
@@ -480,3 +491,726 @@ def assert_column_equal(clean, target, column):
         target[column]), f"Result should be {clean[column]} but was {target[column]}"
     
 
+
+def test_sanitize_tel_number_shapes():
+    from loader import sanitize_tel_number
+    df = pd.DataFrame({'tel1': ['06.58.57.85.24',
+                                '07-12-34-56-78',
+                                '+33 4 67 40 04 44',
+                                '0033 4 67 40 04 44',
+                                '\n334 67 14 83 00',
+                                '04 67 40 04 44',
+                                '-',
+                                pd.NA]}, dtype='string')
+    expected = pd.Series(['+33 6 58 57 85 24',
+                          '+33 7 12 34 56 78',
+                          '+33 4 67 40 04 44',
+                          '+33 4 67 40 04 44',
+                          '+33 4 67 14 83 00',
+                          pd.NA,
+                          pd.NA,
+                          pd.NA], dtype='string', name='tel1')
+    assert sanitize_tel_number(df)['tel1'].equals(expected)
+
+
+def test_sanitize_adr_voie_rules():
+    from loader import sanitize_adr_voie
+    df = pd.DataFrame({'adr_voie': ['Avenue De Malbosc',
+                                    "Boulevard d'Antigone",
+                                    '110 rue viollet-le-duc, MONTPELLIER',
+                                    'rue Des Araucarias',
+                                    ' ',
+                                    'Montpellier']}, dtype='string')
+    expected = pd.Series(['avenue de Malbosc',
+                          "boulevard d'Antigone",
+                          'rue Viollet-Le-Duc',
+                          'rue des Araucarias',
+                          pd.NA,
+                          pd.NA], dtype='string', name='adr_voie')
+    assert sanitize_adr_voie(df)['adr_voie'].equals(expected)
+
+
+def test_rules_changed(monkeypatch):
+    import loader
+    df = pd.DataFrame({'adr_voie': ["Boulevard d'Antigone, Montpellier"],
+                       'tel1': ['0033/4/67/00/00/00']}, dtype='string')
+    assert loader.sanitize_adr_voie(df.copy())['adr_voie'][0] == "boulevard d'Antigone"
+    assert loader.sanitize_tel_number(df.copy())['tel1'].isna().all()
+    # Toutes les règles lues entrent dans la clé des motifs compilés et du cache
+    monkeypatch.setattr(loader, 'STREET_NOISE', (r',',))
+    monkeypatch.setattr(loader, 'STREET_ELISIONS', ())
+    monkeypatch.setattr(loader, 'TEL_SEPARATOR', r'[\s/]*')
+    assert loader.sanitize_adr_voie(df.copy())['adr_voie'][0] == "boulevard D'antigone Montpellier"
+    assert loader.sanitize_tel_number(df.copy())['tel1'][0] == '+33 4 67 00 00 00'
+    for column, expected in [('adr_voie', "boulevard D'antigone Montpellier"), ('tel1', '+33 4 67 00 00 00')]:
+        namespace, transform = loader._column_transforms()[column]
+        assert loader.clean_uniques(df[column], transform, namespace)[0] == expected
+
+
+def test_clean_uniques_cache():
+    from loader import UniqueValueCache, clean_uniques
+    cache = UniqueValueCache(maxsize=2)
+    def upper(series):
+        return clean_uniques(series, lambda s: s.str.upper(), 'upper', cache)
+
+    series = pd.Series(['a', 'b', pd.NA, 'a'], dtype='string', index=list('uvwx'))
+    assert upper(series).equals(pd.Series(['A', 'B', pd.NA, 'A'], dtype='string', index=list('uvwx')))
+    assert cache.info() == {'hits': 0, 'misses': 2, 'skipped': 0, 'size': 2, 'maxsize': 2}
+
+    # "c" évince "b", le moins récemment utilisé
+    assert upper(pd.Series(['c', 'a'], dtype='string')).tolist() == ['C', 'A']
+    assert cache.info() == {'hits': 1, 'misses': 3, 'skipped': 0, 'size': 2, 'maxsize': 2}
+    assert upper(series).tolist() == ['A', 'B', pd.NA, 'A']
+    assert cache.info() == {'hits': 2, 'misses': 4, 'skipped': 0, 'size': 2, 'maxsize': 2}
+
+    # Plus de valeurs distinctes que le cache n'en contient : il n'est pas utilisé
+    assert upper(pd.Series(['d', 'e', 'f', 'd'], dtype='string')).tolist() == ['D', 'E', 'F', 'D']
+    assert cache.info() == {'hits': 2, 'misses': 4, 'skipped': 3, 'size': 2, 'maxsize': 2}
+
+
+def test_load_formatted_data_pyarrow_engine(sample_dirty_fname, sample_formatted):
+    pytest.importorskip('pyarrow')
+    from loader import load_formatted_data
+    assert load_formatted_data(sample_dirty_fname, engine='pyarrow').equals(sample_formatted)
+
+
+def test_load_formatted_data_unparsable_coordinates(sample_dirty_fname, tmp_path):
+    from loader import load_formatted_data
+    dirty = pd.read_csv(sample_dirty_fname, dtype=str, keep_default_na=False)
+    dirty.loc[0, 'lat_coor1'] = 'inconnue'
+    fname = tmp_path / 'dirty.csv'
+    dirty.to_csv(fname, index=False)
+
+    df = load_formatted_data(fname)
+    assert df['lat_coor1'].dtype == 'float'
+    assert np.isnan(df.loc[0, 'lat_coor1'])
+    assert df.loc[2, 'lat_coor1'] == 3.86476856812559
+
+
+@pytest.mark.parametrize('chunksize', [1, 4, 100])
+def test_iter_clean_data(sample_dirty_fname, sample_framed, chunksize):
+    from loader import iter_clean_data
+    chunks = list(iter_clean_data(sample_dirty_fname, chunksize=chunksize))
+    assert len(chunks) == -(-len(sample_framed) // chunksize)
+    assert pd.concat(chunks).equals(sample_framed)
+
+
+def test_iter_clean_data_unparsable_coordinates(sample_dirty_fname, tmp_path):
+    from loader import iter_clean_data
+    dirty = pd.read_csv(sample_dirty_fname, dtype=str, keep_default_na=False)
+    dirty.loc[9, 'long_coor1'] = 'inconnue'
+    fname = tmp_path / 'dirty.csv'
+    dirty.to_csv(fname, index=False)
+
+    df = pd.concat(iter_clean_data(fname, chunksize=4))
+    assert df.index.equals(pd.RangeIndex(len(dirty)))
+    assert np.isnan(df.loc[9, 'long_coor1'])
+    assert df.loc[10, 'long_coor1'] == 43.5989740313524
+
+
+def test_write_clean_data(sample_dirty_fname, sample_framed, tmp_path):
+    from loader import write_clean_data
+    output = tmp_path / 'clean.csv'
+    assert write_clean_data(sample_dirty_fname, output, chunksize=5) == len(sample_framed)
+    written = pd.read_csv(output, dtype='string')
+    assert written['address'].equals(sample_framed['address'])
+
+
+@pytest.mark.parametrize('chunksize', [None, 3])
+def test_load_clean_data_workers(sample_dirty_fname, sample_framed, chunksize):
+    from loader import load_clean_data
+    assert load_clean_data(sample_dirty_fname, chunksize=chunksize, workers=2).equals(sample_framed)
+
+
+@pytest.mark.parametrize('fingerprint', ['mtime', 'content'])
+def test_load_clean_data_cache(sample_dirty_fname, sample_framed, tmp_path, monkeypatch, fingerprint):
+    pytest.importorskip('pyarrow')
+    import loader
+    cache_dir = tmp_path / 'cache'
+    assert loader.load_clean_data(sample_dirty_fname, cache_dir=cache_dir, fingerprint=fingerprint).equals(sample_framed)
+    cached = list(cache_dir.iterdir())
+    assert len(cached) == 1
+
+    # Le second appel lit le cache sans relire le csv
+    monkeypatch.setattr(loader, 'load_formatted_data', None)
+    assert loader.load_clean_data(sample_dirty_fname, cache_dir=cache_dir, fingerprint=fingerprint).equals(sample_framed)
+    monkeypatch.undo()
+
+    # Un changement des règles invalide le cache
+    monkeypatch.setattr(loader, 'CLEANING_VERSION', loader.CLEANING_VERSION + 1)
+    loader.load_clean_data(sample_dirty_fname, cache_dir=cache_dir, fingerprint=fingerprint)
+    recached = list(cache_dir.iterdir())
+    assert len(recached) == 1 and recached != cached
+
+
+def test_load_clean_data_cache_slots(sample_dirty_fname, sample_framed, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    import shutil
+    import loader
+    cache_dir = tmp_path / 'cache'
+    # Même nom de fichier dans deux dossiers, et un nom qui en prolonge un autre
+    sources = [sample_dirty_fname, tmp_path / 'sample_dirty.csv', tmp_path / 'sample_dirty-2020.csv']
+    for source in sources[1:]:
+        shutil.copy(sample_dirty_fname, source)
+    for source in sources:
+        for categorical in (False, True):
+            loader.load_clean_data(source, cache_dir=cache_dir, categorical=categorical)
+    assert len(list(cache_dir.iterdir())) == 6
+
+    # Les caches des autres options et des autres fichiers ne sont pas supprimés
+    monkeypatch.setattr(loader, 'load_formatted_data', None)
+    for source in sources:
+        assert loader.load_clean_data(source, cache_dir=cache_dir).equals(sample_framed)
+        assert isinstance(loader.load_clean_data(source, cache_dir=cache_dir, categorical=True)['address'].dtype,
+                          pd.CategoricalDtype)
+
+
+@pytest.mark.parametrize('string_storage', [None, 'pyarrow'])
+def test_load_clean_data_cache_categorical(sample_dirty_fname, tmp_path, string_storage):
+    pytest.importorskip('pyarrow')
+    from loader import load_clean_data
+    options = {'cache_dir': tmp_path / 'cache', 'categorical': True, 'string_storage': string_storage}
+    df = load_clean_data(sample_dirty_fname, **options)
+    # Lu depuis le cache : catégories en chaînes comme au premier appel
+    cached = load_clean_data(sample_dirty_fname, **options)
+    assert cached['address'].cat.categories.dtype == pd.StringDtype(string_storage)
+    pd.testing.assert_frame_equal(cached, df)
+
+
+def test_update_clean_data(sample_dirty_fname, tmp_path):
+    pytest.importorskip('pyarrow')
+    from loader import load_clean_data, update_clean_data
+    snapshot = tmp_path / 'snapshot.parquet'
+    df, report = update_clean_data(sample_dirty_fname, snapshot)
+    assert df.equals(load_clean_data(sample_dirty_fname))
+    assert len(report['added']) == len(df) and report['deleted'].empty
+
+    # Une ligne modifiée, une supprimée, une ajoutée
+    dirty = pd.read_csv(sample_dirty_fname, dtype=str, keep_default_na=False)
+    dirty.loc[2, 'tel1'] = '06 11 22 33 44'
+    deleted_name = dirty.loc[12, 'nom']
+    dirty = pd.concat([dirty.drop(index=12), dirty.iloc[[0]].assign(nom='Nouveau')], ignore_index=True)
+    fname = tmp_path / 'dirty.csv'
+    dirty.to_csv(fname, index=False)
+
+    df, report = update_clean_data(fname, snapshot)
+    assert df.equals(load_clean_data(fname))
+    # Sans clé, une ligne modifiée est vue comme supprimée puis ajoutée
+    assert list(report['added']) == [2, 13]
+    assert sorted(report['deleted']['nom']) == sorted([deleted_name, 'Ecole maternelle Aliénor-d\'Aquitaine - Ecole élémentaire Ronsard'])
+
+    # Avec une clé, la même ligne est vue comme modifiée
+    update_clean_data(sample_dirty_fname, snapshot, key=['nom'])
+    df, report = update_clean_data(fname, snapshot, key=['nom'])
+    assert df.equals(load_clean_data(fname))
+    assert list(report['changed']) == [2] and list(report['added']) == [13]
+    assert list(report['deleted']['nom']) == [deleted_name]
+
+
+@pytest.fixture
+def http_server():
+    """Local stand-in for the open data portal, with ETag and Range support"""
+    import http.server
+    import threading
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.requests.append(dict(self.headers))
+            # Contenu propre à un chemin, sinon le même pour tous
+            payload = server.payloads.get(self.path.split('?')[0], server.payload)
+            etag = f'"{len(payload)}-{hash(payload)}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body, status = payload, 200
+            if self.headers.get('Range') and self.headers.get('If-Range') == etag:
+                start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+                body, status = payload[start:], 206
+            self.send_response(status)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.payload, server.payloads = b'', {}
+    server.url = f'http://127.0.0.1:{server.server_port}/export.csv?format=csv'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_data(http_server, sample_dirty_fname, tmp_path):
+    from loader import download_data
+    with open(sample_dirty_fname, 'rb') as f:
+        http_server.payload = f.read()
+
+    data_path = download_data(http_server.url, data_dir=tmp_path)
+    assert data_path == str(tmp_path / 'export.csv')
+    with open(data_path, 'rb') as f:
+        assert f.read() == http_server.payload
+
+    # Fichier inchangé sur le serveur : requête conditionnelle, réponse 304
+    download_data(http_server.url, force_download=True, data_dir=tmp_path)
+    assert http_server.requests[-1]['If-None-Match']
+    assert len(os.listdir(tmp_path)) == 2
+
+    # Fichier modifié : nouveau téléchargement
+    http_server.payload += http_server.payload.splitlines(keepends=True)[1]
+    download_data(http_server.url, force_download=True, data_dir=tmp_path)
+    with open(data_path, 'rb') as f:
+        assert f.read() == http_server.payload
+
+
+def test_download_data_resume(http_server, sample_dirty_fname, tmp_path):
+    from loader import download_data
+    with open(sample_dirty_fname, 'rb') as f:
+        http_server.payload = f.read()
+    etag = f'"{len(http_server.payload)}-{hash(http_server.payload)}"'
+    with open(tmp_path / 'export.csv.part', 'wb') as f:
+        f.write(http_server.payload[:100])
+    with open(tmp_path / 'export.csv.part.json', 'w') as f:
+        json.dump({'etag': etag, 'last_modified': None}, f)
+
+    data_path = download_data(http_server.url, data_dir=tmp_path)
+    assert http_server.requests[-1]['Range'] == 'bytes=100-'
+    with open(data_path, 'rb') as f:
+        assert f.read() == http_server.payload
+    assert sorted(os.listdir(tmp_path)) == ['export.csv', 'export.csv.meta.json']
+
+
+def test_download_data_encoding(http_server, tmp_path):
+    from loader import download_data
+    text = 'nom,adr_voie,com_nom\n' + 30 * ("Médiathèque Émile Zola,rue de l'Université,Montpellier\n"
+                                          'Piscine Jean Vivès,allée des Étudiants,Montpellier\n')
+    http_server.payload = text.encode('latin-1')
+    data_path = download_data(http_server.url, data_dir=tmp_path)
+    with open(data_path, encoding='utf-8') as f:
+        assert f.read() == text
+
+
+def test_stage_hooks(sample_dirty_fname, sample_framed, capsys):
+    import tracemalloc
+    from loader import load_clean_data, record_stages
+    tracemalloc.start()
+    try:
+        with record_stages() as records:
+            assert load_clean_data(sample_dirty_fname).equals(sample_framed)
+    finally:
+        tracemalloc.stop()
+    assert capsys.readouterr().out == ''
+
+    stages = [record['stage'] for record in records]
+    assert stages[:4] == ['apply_corrections', 'parse_dates', 'format_data', 'load_formatted_data']
+    assert stages[-2:] == ['sanitize_data', 'frame_data']
+    assert {'sanitize_tel_number', 'sanitize_adr_voie', 'sanitize_cp'} <= set(stages)
+
+    frame = records[-1]
+    assert frame['rows_in'] == frame['rows_out'] == len(sample_framed)
+    assert frame['na_counts']['address'] == 2
+    assert frame['tracemalloc_peak'] > 0 and frame['wall_time'] >= 0
+
+    # Sans hook enregistré, plus rien n'est mesuré
+    load_clean_data(sample_dirty_fname)
+    assert len(records) == len(stages)
+
+
+def test_stage_hooks_error(sample_formatted):
+    import tracemalloc
+    import loader
+    tracemalloc.start()
+    try:
+        with loader.record_stages() as records:
+            # Une étape qui lève ne laisse pas son pic mémoire en place
+            with pytest.raises(KeyError):
+                loader.sanitize_data(sample_formatted.drop(columns='com_cp'))
+            assert loader._MEMORY_PEAKS == []
+            loader.sanitize_data(sample_formatted)
+    finally:
+        tracemalloc.stop()
+    assert records[-1]['stage'] == 'sanitize_data' and records[-1]['tracemalloc_peak'] > 0
+
+
+def test_pipeline_does_not_mutate_input(sample_formatted, sample_sanitized, sample_framed):
+    from loader import frame_data, sanitize_data
+    formatted = sample_formatted.copy()
+    assert sanitize_data(sample_formatted).equals(sample_sanitized)
+    assert sample_formatted.equals(formatted)
+
+    sanitized = sample_sanitized.copy()
+    assert frame_data(sample_sanitized).equals(sample_framed)
+    assert sample_sanitized.equals(sanitized)
+
+
+def test_pipeline_in_place(sample_formatted, sample_sanitized):
+    from loader import sanitize_data
+    assert sanitize_data(sample_formatted, copy=False) is sample_formatted
+    assert sample_formatted.equals(sample_sanitized)
+
+
+@pytest.mark.parametrize('chunksize', [100, 5])
+def test_iter_clean_data_pyarrow_strings(sample_dirty_fname, sample_framed, chunksize):
+    import warnings
+    pytest.importorskip('pyarrow')
+    from loader import iter_clean_data
+    arrow_string = pd.StringDtype('pyarrow')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.PerformanceWarning)
+        df = pd.concat(iter_clean_data(sample_dirty_fname, chunksize=chunksize, string_storage='pyarrow'))
+    for column in ['nom', 'address', 'tel1', 'freq_mnt']:
+        assert df[column].dtype == arrow_string
+    assert df['address'].isna().sum() == 2 and df['address'][1] is pd.NA
+    assert df.astype({column: 'string' for column in ['nom', 'address', 'tel1', 'freq_mnt']}).equals(sample_framed)
+
+
+def test_iter_clean_data_pyarrow_engine(sample_dirty_fname, tmp_path):
+    from loader import iter_clean_data, write_clean_data
+    # pandas ne lit pas le csv par morceaux avec le moteur pyarrow
+    with pytest.raises(ValueError, match='chunksize'):
+        next(iter_clean_data(sample_dirty_fname, chunksize=5, engine='pyarrow'))
+    with pytest.raises(ValueError, match='chunksize'):
+        write_clean_data(sample_dirty_fname, tmp_path / 'clean.csv', engine='pyarrow')
+
+
+@pytest.mark.parametrize('engine', [None, 'pyarrow'])
+def test_load_formatted_data_pyarrow_strings(sample_dirty_fname, sample_formatted, engine):
+    pytest.importorskip('pyarrow')
+    from loader import load_formatted_data
+    df = load_formatted_data(sample_dirty_fname, engine=engine, string_storage='pyarrow')
+    assert df['adr_voie'].dtype == pd.StringDtype('pyarrow')
+    assert df.astype({column: 'string' for column in df.columns if df[column].dtype == 'string'}).equals(sample_formatted)
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 4}, {'chunksize': 2}, {'workers': 2}])
+def test_load_clean_data_categorical(sample_dirty_fname, sample_framed, options):
+    import warnings
+    from loader import load_clean_data
+    with warnings.catch_warnings():
+        # Morceaux sans adresse : pas d'avertissement de pd.concat sur les entrées vides
+        warnings.simplefilter('error', FutureWarning)
+        df = load_clean_data(sample_dirty_fname, categorical=True, **options)
+    assert isinstance(df['address'].dtype, pd.CategoricalDtype)
+    assert list(df['freq_mnt'].cat.categories) == ['tous les ans']
+    assert df['address'].cat.categories.is_unique and not df['address'].cat.categories.hasnans
+    assert df.astype({'address': 'string', 'freq_mnt': 'string'}).equals(sample_framed)
+
+
+def test_sanitize_data_categorical(sample_formatted, sample_sanitized):
+    from loader import sanitize_data
+    df = sanitize_data(sample_formatted, categorical=True)
+    assert sorted(df['com_cp'].cat.categories) == ['34000', '34070']
+    assert df.astype({'com_nom': 'string', 'freq_mnt': 'string', 'com_cp': 'string'}).equals(sample_sanitized)
+
+
+def test_sanitize_coordinates():
+    from loader import sanitize_coordinates
+    df = pd.DataFrame({
+        # Inversée, correcte, hors zone, manquante, doublon de la première
+        'lat_coor1': [3.93392108647369, 43.5982457955311, 48.85, np.nan, 43.6136351580956],
+        'long_coor1': [43.6136351580956, 3.84314264933544, 2.35, 3.9, 3.93392108647369],
+    })
+    df = sanitize_coordinates(df, projected=True)
+    assert df['lat_coor1'].tolist()[:3] == [43.6136351580956, 43.5982457955311, 48.85]
+    assert df['long_coor1'].tolist()[:3] == [3.93392108647369, 3.84314264933544, 2.35]
+    assert df['coord_swapped'].tolist() == [True, False, False, False, False]
+    assert df['coord_out_of_area'].tolist() == [False, False, True, False, False]
+    assert df['coord_duplicate'].tolist() == [True, False, False, False, True]
+    # x/y de l'export pour ce défibrillateur
+    assert df.loc[0, 'x'] == pytest.approx(775412.3055, abs=1e-3)
+    assert df.loc[0, 'y'] == pytest.approx(6279844.1872, abs=1e-3)
+    assert np.isnan(df.loc[3, 'x'])
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 4}])
+def test_load_clean_data_coordinates(sample_dirty_fname, sample_framed, options):
+    from loader import load_clean_data
+    df = load_clean_data(sample_dirty_fname, coordinates=True, **options)
+    # Une position incomplète (ligne 11) n'est pas inversée
+    located = sample_framed['lat_coor1'].notna() & sample_framed['long_coor1'].notna()
+    assert df['coord_swapped'].equals(located)
+    assert np.array_equal(df.loc[located, 'lat_coor1'], sample_framed.loc[located, 'long_coor1'])
+    assert np.array_equal(df.loc[located, 'long_coor1'], sample_framed.loc[located, 'lat_coor1'])
+    assert not df['coord_out_of_area'].any()
+    assert df.drop(columns=['lat_coor1', 'long_coor1', 'coord_swapped', 'coord_out_of_area', 'coord_duplicate']).equals(
+        sample_framed.drop(columns=['lat_coor1', 'long_coor1']))
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 5}, {'workers': 2}])
+def test_load_clean_data_duplicate_coordinates(sample_dirty_fname, tmp_path, options):
+    import csv
+    from loader import load_clean_data, scan_clean_data
+    # Les lignes 0 et 13 ont la même position, dans des morceaux différents
+    with open(sample_dirty_fname, newline='') as f:
+        rows = list(csv.DictReader(f))
+    rows[13]['lat_coor1'], rows[13]['long_coor1'] = rows[0]['lat_coor1'], rows[0]['long_coor1']
+    data_path = tmp_path / 'duplicated.csv'
+    with open(data_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+
+    df = load_clean_data(data_path, coordinates=True, **options)
+    assert list(df.index[df['coord_duplicate']]) == [0, 13]
+    plan = scan_clean_data(data_path, coordinates=True, chunksize=options.get('chunksize'))
+    collected = plan.select('nom', 'coord_duplicate').collect()
+    assert list(collected.columns) == ['nom', 'coord_duplicate']
+    assert collected['coord_duplicate'].equals(df['coord_duplicate'])
+
+
+def test_parse_dates(monkeypatch):
+    import loader
+    cache = loader.UniqueValueCache()
+    monkeypatch.setattr(loader, 'SANITIZE_CACHE', cache)
+    df = pd.DataFrame({'dermnt': pd.array(['2019-05-15', '2018-12-6', '15/05/2019', pd.NA, 'Tous les ans',
+                                           '2019-05-15'], dtype='string')},
+                      index=[10, 11, 12, 13, 14, 15])
+    failures = {}
+    df = loader.parse_dates(df, failures=failures)
+    # Les valeurs distinctes ne sont converties qu'une fois, puis lues dans le cache
+    assert cache.info()['misses'] == 4
+    loader.parse_dates(pd.DataFrame({'dermnt': pd.array(['2018-12-6'], dtype='string')}))
+    assert cache.info()['hits'] == 1
+
+    assert df['dermnt'].dtype == 'datetime64[ns]'
+    assert df['dermnt'].tolist()[:3] == [pd.Timestamp('2019-05-15'), pd.Timestamp('2018-12-06'),
+                                         pd.Timestamp('2019-05-15')]
+    assert list(failures['dermnt']) == [14]
+
+
+def test_load_clean_data_extra_dates(sample_dirty_fname, sample_framed, tmp_path):
+    from loader import EXTRA_DATE_COLUMNS, load_clean_data
+    dirty = pd.read_csv(sample_dirty_fname, dtype=str, keep_default_na=False)
+    dirty['date_insta'] = ['2017-12-1', ' '] * 7
+    for column in EXTRA_DATE_COLUMNS[1:]:
+        dirty[column] = ' '
+    fname = tmp_path / 'dirty.csv'
+    dirty.to_csv(fname, index=False)
+
+    df = load_clean_data(fname, extra_dates=True)
+    assert df.columns[-len(EXTRA_DATE_COLUMNS):].tolist() == list(EXTRA_DATE_COLUMNS)
+    assert df['date_insta'].tolist()[:2] == [pd.Timestamp('2017-12-01'), pd.NaT]
+    assert df.drop(columns=list(EXTRA_DATE_COLUMNS)).equals(sample_framed)
+    assert load_clean_data(fname, extra_dates=True, chunksize=4).equals(df)
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 4}, {'workers': 2}])
+def test_corrections(sample_dirty_fname, sample_framed, tmp_path, monkeypatch, options):
+    import loader
+    keys = loader.row_keys(sample_dirty_fname)
+    # Les lignes de l'export réel ont les mêmes clés, quelle que soit leur position
+    assert loader.row_keys(loader.DATA_PATH)[272] == keys[5]
+
+    corrections = tmp_path / 'corrections.csv'
+    pd.DataFrame({
+        'row_hash': [keys[5], keys[5], keys[9], keys[9]],
+        'column': ['freq_mnt', 'dermnt', 'nom', 'lat_coor1'],
+        'value': ['', '', 'Dell', '3.9'],
+        'comment': ['', '', 'Nom complété', 'Position corrigée'],
+    }).to_csv(corrections, index=False)
+    monkeypatch.setattr(loader, 'CORRECTIONS_PATH', str(corrections))
+
+    df = loader.load_clean_data(sample_dirty_fname, **options)
+    expected = sample_framed.copy()
+    expected.loc[9, ['nom', 'lat_coor1']] = ['Dell', 3.9]
+    assert df.equals(expected)
+
+
+def test_corrections_duplicated(sample_dirty_fname, tmp_path, monkeypatch):
+    import loader
+    corrections = tmp_path / 'corrections.csv'
+    corrections.write_text('row_hash,column,value,comment\n1,nom,a,\n1,nom,b,\n')
+    monkeypatch.setattr(loader, 'CORRECTIONS_PATH', str(corrections))
+    with pytest.raises(ValueError):
+        loader.load_formatted_data(sample_dirty_fname)
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 4}, {'categorical': True}, {'coordinates': True}])
+def test_clean_plan(sample_dirty_fname, options):
+    from loader import load_clean_data, scan_clean_data
+    assert scan_clean_data(sample_dirty_fname, **options).collect().equals(
+        load_clean_data(sample_dirty_fname, **options))
+
+
+def test_clean_plan_select(sample_dirty_fname, sample_framed):
+    from loader import COLUMNS, scan_clean_data
+    plan = scan_clean_data(sample_dirty_fname).select('nom', 'lat_coor1', 'long_coor1')
+    # Ni l'adresse ni le téléphone ne sont lus ou nettoyés
+    assert plan.source_columns == ['nom', 'lat_coor1', 'long_coor1']
+    assert plan.collect().equals(sample_framed[['nom', 'lat_coor1', 'long_coor1']])
+
+    # freq_mnt est corrigée : la clé des corrections dépend de toutes les colonnes
+    assert scan_clean_data(sample_dirty_fname).select('freq_mnt').source_columns == list(COLUMNS)
+    with pytest.raises(ValueError):
+        scan_clean_data(sample_dirty_fname).select('adr_voie')
+
+
+def test_clean_plan_transform(sample_dirty_fname, sample_framed):
+    from loader import scan_clean_data
+    calls = []
+
+    def upper(values):
+        calls.append(values.tolist())
+        return values.str.upper()
+
+    plan = (scan_clean_data(sample_dirty_fname)
+            .transform('nom', upper)
+            .transform('nom', lambda values: values.str.replace(' ', '_'))
+            .select('nom', 'address'))
+    assert 'nom: upper + <lambda> (fused)' in plan.explain()
+    df = plan.collect()
+    assert df['nom'].equals(sample_framed['nom'].str.upper().str.replace(' ', '_'))
+    assert df['address'].equals(sample_framed['address'])
+    # Une fonction appelée une fois, sur les valeurs distinctes
+    assert calls == [sample_framed['nom'].dropna().unique().tolist()]
+
+    # Sur une partie de l'adresse, la transformation précède l'assemblage
+    df = scan_clean_data(sample_dirty_fname).transform('adr_voie', upper).select('address').collect()
+    assert df.loc[0, 'address'] == 'AVENUE ALBERT EINSTEIN 34000 Montpellier'
+
+
+def test_sanitize_adr_num_structured():
+    from loader import frame_data, sanitize_adr_num
+    df = pd.DataFrame({
+        'adr_num': pd.array(['694 -700', '19 BIS', ' 1 place Jacques Mirouse, MONTPELLIER', '-', pd.NA, '12A', '3,',
+                             'Bat A', 'SN', 'face au 12', 'Bat 12A'], dtype='string'),
+        'adr_voie': pd.array(['rue Jacques-Bounin', 'rue durand', 'place Jacques Mirouse', '8 ter rue du Lavandin',
+                              '74 rue Ray Charles', 'rue durand', 'rue durand', 'rue durand', 'rue du 8 mai 1945',
+                              'rue durand', 'rue durand'], dtype='string'),
+    })
+    df = sanitize_adr_num(df, structured=True)
+    # Sans numéro reconnu, les mots alphabétiques sont retirés comme avant
+    assert df['adr_num'].tolist() == ['694-700', '19 bis', '1', '8 ter', '74', '12A', '3', pd.NA, pd.NA, '12', '12A']
+    assert df['adr_num_start'].tolist() == [694, 19, 1, 8, 74, pd.NA, 3, pd.NA, pd.NA, 12, pd.NA]
+    assert df['adr_num_end'].tolist() == [700] + [pd.NA] * 10
+    assert df['adr_num_suffix'].tolist() == [pd.NA, 'bis', pd.NA, 'ter'] + [pd.NA] * 7
+    # Le numéro repris de la voie n'y reste pas : l'adresse ne le répète pas
+    assert df['adr_voie'][3] == 'rue du Lavandin'
+    framed = frame_data(df.assign(com_cp='34000', com_nom='Montpellier', nom='', tel1='', freq_mnt=''))
+    assert framed['address'][3] == '8 ter rue du Lavandin 34000 Montpellier'
+    assert framed['address'][2] == '1 place Jacques Mirouse 34000 Montpellier'
+    assert df['adr_num_start'].dtype == 'Int64'
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 4}])
+def test_load_clean_data_address_numbers(sample_dirty_fname, sample_framed, sample_sanitized, options):
+    from loader import ADDRESS_NUMBER_COLUMNS, load_clean_data, scan_clean_data
+    df = load_clean_data(sample_dirty_fname, address_numbers=True, **options)
+    assert df.drop(columns=list(ADDRESS_NUMBER_COLUMNS)).equals(sample_framed)
+    assert df['adr_num_start'].tolist() == pd.to_numeric(
+        sample_sanitized['adr_num'].str.extract(r'^(\d+)')[0]).astype('Int64').tolist()
+    assert df.loc[[2, 4, 13], 'adr_num_end'].tolist() == [700, 289, 460]
+    assert df.loc[6, 'adr_num_suffix'] == 'bis'
+
+    plan = scan_clean_data(sample_dirty_fname, address_numbers=True, **options)
+    assert plan.collect().equals(df)
+    assert plan.select('adr_num_start').source_columns == ['adr_num', 'adr_voie']
+
+
+@pytest.mark.parametrize('options', [{}, {'chunksize': 4}, {'categorical': True}])
+def test_load_clean_data_postal_codes(sample_dirty_fname, sample_framed, sample_sanitized, tmp_path, options):
+    from loader import load_clean_data, scan_clean_data
+    df = load_clean_data(sample_dirty_fname, postal_codes=True, cache_dir=tmp_path, **options)
+    assert list(df.columns[:3]) == ['nom', 'address', 'com_cp']
+    assert df['com_cp'].astype(object).tolist() == sample_sanitized['com_cp'].astype(object).tolist()
+    assert df.drop(columns='com_cp').equals(load_clean_data(sample_dirty_fname, **options))
+    # Une entrée de cache à part, relue telle quelle
+    assert load_clean_data(sample_dirty_fname, postal_codes=True, cache_dir=tmp_path, **options).equals(df)
+    assert 'com_cp' not in load_clean_data(sample_dirty_fname, cache_dir=tmp_path, **options).columns
+    assert scan_clean_data(sample_dirty_fname, postal_codes=True, **options).collect().equals(df)
+
+
+def test_main(http_server, sample_dirty_fname, sample_framed, tmp_path, capsys):
+    from loader import main
+    with open(sample_dirty_fname, 'rb') as f:
+        http_server.payload = f.read()
+    base_url = f'http://127.0.0.1:{http_server.server_port}'
+    sources = [f'{base_url}/montpellier.csv', f'{base_url}/nimes.csv?format=csv', sample_dirty_fname,
+               str(tmp_path / 'missing.csv')]
+    output_dir = tmp_path / 'clean'
+
+    # Une source en erreur n'empêche pas le nettoyage des autres
+    assert main(sources + ['-o', str(output_dir), '--data-dir', str(tmp_path / 'raw'), '--workers', '2']) == 1
+    summary = capsys.readouterr().out
+    assert 'missing.csv  failed: FileNotFoundError' in summary
+    assert '3/4 files  42 rows' in summary and 'rows/s' in summary
+    assert sorted(os.listdir(output_dir)) == ['montpellier.csv', 'nimes.csv', 'sample_dirty.csv']
+    for name in os.listdir(output_dir):
+        written = pd.read_csv(output_dir / name, dtype='string')
+        assert written['address'].equals(sample_framed['address'])
+
+    pytest.importorskip('pyarrow')
+    assert main(sources[2:3] + ['-o', str(output_dir), '--format', 'parquet', '--chunksize', '5']) == 0
+    written = pd.read_parquet(output_dir / 'sample_dirty.parquet')
+    assert written['address'].tolist() == sample_framed['address'].tolist()
+
+
+def test_clean_files_same_file_name(http_server, sample_dirty_fname, tmp_path):
+    from loader import clean_files
+    with open(sample_dirty_fname, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    base_url = f'http://127.0.0.1:{http_server.server_port}'
+    # Deux portails exportent sous le même nom : chacun a son propre fichier
+    http_server.payloads = {'/lyon/exports/csv': b''.join(lines[:6]), '/nice/exports/csv': b''.join(lines)}
+    sources = [f'{base_url}/lyon/exports/csv', f'{base_url}/nice/exports/csv']
+    results = clean_files(sources, data_dir=tmp_path / 'raw', download_workers=2, workers=1)
+    assert [result['error'] for result in results] == [None, None]
+    assert [result['rows'] for result in results] == [5, 14]
+    with pytest.raises(ValueError):
+        clean_files(sources[:1] * 2, data_dir=tmp_path / 'raw')
+
+
+def test_http_session_per_thread():
+    import threading
+    from loader import _http_session
+    pytest.importorskip('requests')
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(_http_session()))
+    thread.start()
+    thread.join()
+    assert _http_session() is _http_session() and sessions[0] is not _http_session()
+
+
+def test_clean_files_fail_fast(sample_dirty_fname, tmp_path):
+    from loader import clean_files
+    sources = [str(tmp_path / 'missing.csv')] + [sample_dirty_fname] * 10
+    results = clean_files(sources, workers=1, fail_fast=True)
+    assert results[0]['error'].startswith('FileNotFoundError')
+    # Les fichiers déjà transmis au processus sont nettoyés, les autres annulés
+    errors = [result['error'] for result in results[1:]]
+    assert set(errors) == {None, 'cancelled'}
+    assert all(result['rows'] == 14 for result in results[1:] if result['error'] is None)
+    with pytest.raises(ValueError):
+        clean_files([sample_dirty_fname, sample_dirty_fname], output_dir=tmp_path)
+
+
+def test_shared_frame(sample_dirty_fname, sample_framed, tmp_path, monkeypatch):
+    pa = pytest.importorskip('pyarrow')
+    import loader
+    shared_path = tmp_path / 'shared' / 'dae.arrow'
+    df = loader.load_clean_data(sample_dirty_fname, shared_path=shared_path)
+    assert df['nom'].dtype == pd.StringDtype('pyarrow')
+    assert df.astype(sample_framed.dtypes.to_dict()).equals(sample_framed)
+    # Les colonnes texte lisent le fichier mappé en lecture seule, sans copie
+    assert not any(buffer.is_mutable for buffer in pa.array(df['address'].array).buffers() if buffer is not None)
+
+    # Les autres processus mappent le snapshot sans relire le csv
+    monkeypatch.setattr(loader, 'load_formatted_data', None)
+    assert loader.load_clean_data(sample_dirty_fname, shared_path=shared_path).equals(df)
+    monkeypatch.undo()
+
+    # Un nouveau snapshot remplace l'ancien, encore lisible par ceux qui l'utilisent
+    reader = loader.SharedFrame(shared_path)
+    first = reader.frame()
+    assert reader.frame() is first
+    loader.publish_shared_frame(first.head(3), shared_path)
+    assert len(reader.frame()) == 3 and first.equals(df)
+    # Un snapshot publié pour d'autres données n'est pas repris
+    assert loader.load_clean_data(sample_dirty_fname, shared_path=shared_path).equals(df)
+    assert len(reader.frame()) == len(df)
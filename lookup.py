@@ -0,0 +1,208 @@
+import bisect
+
+import numpy as np
+import pandas as pd
+
+
+class LookupIndex:
+    """Lookup indexes over a clean frame (see loader.load_clean_data).
+
+    postal_code and address are hash lookups (O(1)), name_prefix a binary
+    search in the case-folded names kept sorted (O(log n)). They return the
+    row positions in df, in increasing order.
+    frame_data merges com_cp into the address: it is read from df when kept
+    there (load_clean_data(postal_codes=True)), or given as postal_codes,
+    one value per row of df.
+    After rows changed, update() only reads the rows removed and added, and
+    inserts them in place: nothing is sorted again.
+    """
+
+    def __init__(self, df:pd.DataFrame, postal_codes:pd.Series=None):
+        self.df = df
+        self._postal_codes = _HashIndex(_postal_codes(df, postal_codes))
+        self._addresses = _HashIndex(df['address'])
+        self._names = _PrefixIndex(df['nom'])
+
+    def __len__(self):
+        return len(self.df)
+
+    def postal_code(self, code:str) -> np.ndarray:
+        """Positions of the rows with the postal code code"""
+        return self._postal_codes.get(code)
+
+    def address(self, address:str) -> np.ndarray:
+        """Positions of the rows at exactly address"""
+        return self._addresses.get(address)
+
+    def name_prefix(self, prefix:str) -> np.ndarray:
+        """Positions of the rows whose nom starts with prefix, ignoring case"""
+        return self._names.get(prefix)
+
+    def rows(self, positions:np.ndarray) -> pd.DataFrame:
+        return self.df.iloc[positions]
+
+    def update(self, df:pd.DataFrame, removed=(), added=(), postal_codes:pd.Series=None):
+        """Index df, the indexed frame after some rows changed.
+
+        removed are the positions (in the previous frame) of the rows
+        deleted or modified, added the positions (in df) of the rows
+        inserted or modified: a row modified in place is in both. The other
+        rows of df are the previous ones, in the same order. postal_codes
+        are those of df, as in the constructor (only the added rows are read).
+        """
+        kept = np.ones(len(self.df), dtype=bool)
+        kept[np.asarray(removed, dtype=np.intp)] = False
+        is_added = np.zeros(len(df), dtype=bool)
+        is_added[np.asarray(added, dtype=np.intp)] = True
+        if kept.sum() != len(df) - is_added.sum():
+            raise ValueError(f'{len(self.df)} rows - {(~kept).sum()} removed + {is_added.sum()} added '
+                             f'do not make the {len(df)} rows of df')
+
+        # Position dans df de chaque ligne conservée
+        moved = np.full(len(self.df), -1, dtype=np.intp)
+        moved[kept] = np.flatnonzero(~is_added)
+        added = np.flatnonzero(is_added)
+        rows = df.iloc[added]
+        self._postal_codes.update(moved, added, _postal_codes(df, postal_codes)[added])
+        self._addresses.update(moved, added, rows['address'])
+        # Les noms retirés sont lus dans le frame précédent, pour les retrouver dans les blocs
+        self._names.update(moved, added, rows['nom'], self.df['nom'].iloc[np.flatnonzero(moved < 0)])
+        self.df = df
+
+
+class _HashIndex:
+    """Rows grouped by value: a dict gives the code of a value, offsets its rows"""
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        self._codes = {value: code for code, value in enumerate(uniques)}
+        self.codes = codes
+        # Tri stable : les positions restent croissantes dans chaque groupe,
+        # les valeurs manquantes (code -1) sont en tête
+        self._order = np.argsort(codes, kind='stable')
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(codes + 1, minlength=len(self._codes) + 1))])
+
+    def get(self, value) -> np.ndarray:
+        code = self._codes.get(value)
+        if code is None:
+            return np.empty(0, dtype=np.intp)
+        return self._order[self._offsets[code + 1]:self._offsets[code + 2]]
+
+    def update(self, moved:np.ndarray, added:np.ndarray, values):
+        # Seules les valeurs ajoutées sont cherchées, les nouvelles reçoivent un code
+        added_codes = np.array([-1 if pd.isna(value) else self._codes.setdefault(value, len(self._codes))
+                                for value in np.asarray(values, dtype=object)], dtype=np.intp)
+        counts = np.zeros(len(self._codes) + 1, dtype=np.intp)
+        counts[:len(self._offsets) - 1] = np.diff(self._offsets)
+        # Lignes retirées hors de leur groupe, les autres renumérotées : moved
+        # est croissant, les groupes restent triés sans retrier
+        counts -= np.bincount(self.codes[moved < 0] + 1, minlength=len(counts))
+        order = moved[self._order]
+        order = order[order >= 0]
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        # Lignes ajoutées insérées à leur rang dans leur groupe ; à la limite de
+        # deux groupes, celles du premier passent devant
+        at = np.array([offsets[code + 1] + np.searchsorted(order[offsets[code + 1]:offsets[code + 2]], position)
+                       for code, position in zip(added_codes, added)], dtype=np.intp)
+        inserted = np.lexsort((added, added_codes, at))
+        self._order = np.insert(order, at[inserted], added[inserted])
+        counts += np.bincount(added_codes + 1, minlength=len(counts))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        codes = np.empty(len(self._order), dtype=np.intp)
+        codes[moved[moved >= 0]] = self.codes[moved >= 0]
+        codes[added] = added_codes
+        self.codes = codes
+
+
+class _PrefixIndex:
+    """Case-folded values kept sorted in blocks: the values with a prefix are one range.
+
+    An update only copies the blocks where rows are removed or inserted.
+    """
+
+    block_size = 4096
+
+    def __init__(self, values):
+        keys, positions = _casefold(values, np.arange(len(values)))
+        order = np.argsort(keys, kind='stable')
+        keys, positions = keys[order], positions[order]
+        starts = range(0, len(keys), self.block_size)
+        self._keys = [keys[start:start + self.block_size] for start in starts]
+        self._positions = [positions[start:start + self.block_size] for start in starts]
+        self._firsts = [block[0] for block in self._keys]
+
+    def get(self, prefix:str) -> np.ndarray:
+        prefix = prefix.casefold()
+        stop = prefix + '\U0010ffff'
+        found = []
+        for block in range(max(bisect.bisect_left(self._firsts, prefix) - 1, 0), len(self._keys)):
+            keys = self._keys[block]
+            if keys[0] >= stop:
+                break
+            found.append(self._positions[block][np.searchsorted(keys, prefix, side='left'):
+                                                np.searchsorted(keys, stop, side='left')])
+        return np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.intp)
+
+    def update(self, moved:np.ndarray, added:np.ndarray, values, removed_values):
+        removed = np.flatnonzero(moved < 0)
+        for key, position in zip(*_casefold(removed_values, removed)):
+            self._remove(key, position)
+        # Positions renumérotées seulement si des lignes ont été décalées
+        kept = np.flatnonzero(moved >= 0)
+        if not np.array_equal(moved[kept], kept):
+            self._positions = [moved[positions] for positions in self._positions]
+        for key, position in zip(*_casefold(values, added)):
+            self._insert(key, position)
+
+    def _remove(self, key:str, position:int):
+        # Les clés égales peuvent déborder sur plusieurs blocs
+        block = max(bisect.bisect_left(self._firsts, key) - 1, 0)
+        while True:
+            keys, positions = self._keys[block], self._positions[block]
+            start = np.searchsorted(keys, key, side='left')
+            found = start + np.flatnonzero(positions[start:np.searchsorted(keys, key, side='right')] == position)
+            if len(found):
+                break
+            block += 1
+        if len(keys) == 1:
+            del self._keys[block], self._positions[block], self._firsts[block]
+            return
+        self._keys[block] = np.delete(keys, found[0])
+        self._positions[block] = np.delete(positions, found[0])
+        self._firsts[block] = self._keys[block][0]
+
+    def _insert(self, key:str, position:int):
+        if not self._keys:
+            self._keys, self._positions, self._firsts = [np.array([key], dtype=object)], [np.array([position])], [key]
+            return
+        block = max(bisect.bisect_right(self._firsts, key) - 1, 0)
+        at = np.searchsorted(self._keys[block], key, side='right')
+        keys = np.insert(self._keys[block], at, key)
+        positions = np.insert(self._positions[block], at, position)
+        # Un bloc trop grand est coupé en deux
+        half = len(keys) // 2 if len(keys) > 2 * self.block_size else len(keys)
+        keys = [part for part in (keys[:half], keys[half:]) if len(part)]
+        self._keys[block:block + 1] = keys
+        self._positions[block:block + 1] = [positions[:half], positions[half:]][:len(keys)]
+        self._firsts[block:block + 1] = [part[0] for part in keys]
+
+
+def _casefold(values, positions:np.ndarray) -> tuple:
+    """Case-folded values (object array) and their positions, without the missing values"""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    # Une seule conversion par valeur distincte
+    folded = np.array([value.casefold() for value in uniques], dtype=object)
+    found = codes >= 0
+    return folded[codes[found]], np.asarray(positions)[found]
+
+
+def _postal_codes(df:pd.DataFrame, postal_codes:pd.Series=None) -> np.ndarray:
+    if postal_codes is None:
+        if 'com_cp' not in df.columns:
+            raise ValueError('df has no com_cp column: pass the sanitized com_cp as postal_codes')
+        postal_codes = df['com_cp']
+    if len(postal_codes) != len(df):
+        raise ValueError(f'{len(postal_codes)} postal codes for the {len(df)} rows of df')
+    # Alignés par position : l'index de df peut différer de celui du com_cp lu
+    return np.asarray(postal_codes, dtype=object)
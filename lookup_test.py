@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(params=[None, 'pyarrow'])
+def clean_df(request) -> pd.DataFrame:
+    from loader import load_clean_data
+    if request.param == 'pyarrow':
+        pytest.importorskip('pyarrow')
+    return load_clean_data('data/MMM_MMM_DAE.csv', string_storage=request.param, postal_codes=True)
+
+
+def scan(mask:pd.Series) -> np.ndarray:
+    return np.flatnonzero(mask.fillna(False).to_numpy(dtype=bool))
+
+
+def assert_same_lookups(index, df):
+    for code in ['34000', '34070', '34172', '99999']:
+        assert np.array_equal(index.postal_code(code), scan(df['com_cp'] == code))
+    for prefix in ['Ecole', 'GYMNASE', 'piscine', 'é', '']:
+        expected = scan(df['nom'].str.casefold().str.startswith(prefix.casefold()))
+        assert np.array_equal(index.name_prefix(prefix), expected)
+    for address in df['address'].dropna().unique()[:20]:
+        assert np.array_equal(index.address(address), scan(df['address'] == address))
+
+
+def test_lookup(clean_df):
+    from lookup import LookupIndex
+    index = LookupIndex(clean_df)
+    assert len(index) == len(clean_df)
+    assert_same_lookups(index, clean_df)
+    assert list(index.rows(index.address('20 rue Emile Littré 34090 Montpellier')).index) == [9]
+    assert 9 in index.postal_code('34090') and len(index.address(pd.NA)) == 0
+    # Une ligne sans adresse (pas d'adr_voie) garde son code postal
+    head = clean_df.head(3).assign(address=[pd.NA, 'rue durand 34080 Montpellier', pd.NA],
+                                   com_cp=['34070', '34080', pd.NA])
+    assert list(LookupIndex(head).postal_code('34070')) == [0]
+
+    # Le code postal peut aussi être donné à part du cadre
+    framed = clean_df.drop(columns='com_cp')
+    separate = LookupIndex(framed, postal_codes=clean_df['com_cp'].reset_index(drop=True))
+    assert np.array_equal(separate.postal_code('34070'), index.postal_code('34070'))
+    with pytest.raises(ValueError):
+        LookupIndex(framed)
+    with pytest.raises(ValueError):
+        LookupIndex(framed, postal_codes=clean_df['com_cp'].iloc[1:])
+
+
+def test_lookup_update(clean_df):
+    from lookup import LookupIndex
+    index = LookupIndex(clean_df)
+    # Lignes 3 et 7 supprimées, ligne 10 modifiée sur place, deux lignes ajoutées à la fin
+    kept = clean_df.drop(index=[3, 7, 10])
+    # Un numéro de voie à cinq chiffres n'est pas un code postal
+    modified = clean_df.loc[[10]].assign(nom='Gymnase modifié', address='12345 rue Neuve 34999 Montpellier',
+                                         com_cp='34999')
+    appended = clean_df.loc[[0, 1]].assign(nom=['ECOLE nouvelle', pd.NA])
+    updated = pd.concat([kept.iloc[:8], modified, kept.iloc[8:], appended], ignore_index=True)
+    index.update(updated, removed=[3, 7, 10], added=[8, len(updated) - 2, len(updated) - 1])
+    assert index.df is updated
+    assert_same_lookups(index, updated)
+    assert list(index.postal_code('34999')) == [8] and len(index.postal_code('12345')) == 0
+    assert 8 in index.name_prefix('gymnase m')
+
+    with pytest.raises(ValueError):
+        index.update(updated, removed=[0])
+
+
+def test_lookup_update_blocks(clean_df, monkeypatch):
+    from lookup import LookupIndex, _PrefixIndex
+    # Petits blocs : les suppressions et insertions vident et coupent des blocs
+    monkeypatch.setattr(_PrefixIndex, 'block_size', 4)
+    rng = np.random.default_rng(0)
+    index, df = LookupIndex(clean_df), clean_df
+    for _ in range(5):
+        removed = rng.choice(len(df), size=15, replace=False)
+        inserted = clean_df.iloc[rng.choice(len(clean_df), size=20)]
+        kept = df.drop(index=df.index[removed])
+        df = pd.concat([inserted.iloc[:10], kept, inserted.iloc[10:]], ignore_index=True)
+        index.update(df, removed=removed, added=np.r_[0:10, len(df) - 10:len(df)])
+        assert_same_lookups(index, df)
+    assert_same_lookups(LookupIndex(df.iloc[:0]), df.iloc[:0])
@@ -0,0 +1,116 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+# Rayon moyen de la Terre, en mètres
+EARTH_RADIUS_M = 6_371_008.8
+
+
+class DefibrillatorIndex:
+    """Spatial index over the defibrillators of a clean frame (see loader.load_clean_data).
+
+    The positions are projected on the unit sphere: the straight (chord)
+    distance between two projected points orders them like the great-circle
+    distance, so a KD-tree answers the nearest/radius queries exactly.
+    Rows without coordinates are left out of the index.
+    Note: the export stores the longitude in lat_coor1 and the latitude in
+    long_coor1, load the frame with coordinates=True to swap them back, or
+    pass lat_column='long_coor1', lon_column='lat_coor1'.
+    """
+
+    def __init__(self, df:pd.DataFrame, lat_column:str='lat_coor1', lon_column:str='long_coor1'):
+        self.df = df
+        lat = df[lat_column].to_numpy(dtype=float)
+        lon = df[lon_column].to_numpy(dtype=float)
+        # Positions (dans df) des lignes indexées
+        self.positions = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        points = _to_unit_vectors(lat[self.positions], lon[self.positions])
+        self._tree = _kdtree()(points)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def nearest_batch(self, lats, lons, k:int=1) -> tuple:
+        """Vectorized k nearest lookup of many positions at once.
+
+        Returns (distances in meters, row positions in df), two arrays of
+        shape (n, k), with inf and -1 where the index has fewer than k rows.
+        """
+        points = _to_unit_vectors(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)).reshape(-1, 3)
+        if not len(self.positions):
+            # Aucune ligne localisée : rien à chercher
+            return np.full((len(points), k), np.inf), np.full((len(points), k), -1, dtype=np.intp)
+        chords, found = self._tree.query(points, k=k)
+        chords, found = np.reshape(chords, (-1, k)), np.reshape(found, (-1, k))
+        missing = found >= len(self.positions)
+        positions = np.where(missing, -1, self.positions[np.minimum(found, len(self.positions) - 1)])
+        return np.where(missing, np.inf, _chord_to_meters(chords)), positions
+
+    def nearest(self, lat:float, lon:float, k:int=1) -> pd.DataFrame:
+        """The k rows of df nearest to (lat, lon), with their distance_m"""
+        distances, positions = self.nearest_batch([lat], [lon], k=k)
+        found = positions[0] >= 0
+        return self._rows(positions[0][found], distances[0][found])
+
+    def within(self, lat:float, lon:float, radius_m:float) -> pd.DataFrame:
+        """The rows of df less than radius_m meters away from (lat, lon), nearest first"""
+        point = _to_unit_vectors(np.array([lat], dtype=float), np.array([lon], dtype=float))[0]
+        found = np.asarray(self._tree.query_ball_point(point, _meters_to_chord(radius_m)), dtype=int)
+        distances = _chord_to_meters(np.linalg.norm(self._tree.data[found] - point, axis=1))
+        order = np.argsort(distances, kind='stable')
+        return self._rows(self.positions[found[order]], distances[order])
+
+    def _rows(self, positions:np.ndarray, distances:np.ndarray) -> pd.DataFrame:
+        return self.df.iloc[positions].assign(distance_m=distances)
+
+
+@functools.lru_cache(maxsize=None)
+def _kdtree():
+    """cKDTree of scipy, imported with the first index built, or _BruteForceTree"""
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:  # scipy est optionnel : recherche exhaustive vectorisée
+        return _BruteForceTree
+    return cKDTree
+
+
+class _BruteForceTree:
+    """Minimal stand-in for cKDTree when scipy is not installed"""
+
+    def __init__(self, data:np.ndarray):
+        self.data = data
+
+    def query(self, points:np.ndarray, k:int=1):
+        chords = np.linalg.norm(points[:, None, :] - self.data[None, :, :], axis=2)
+        order = np.argsort(chords, axis=1, kind='stable')[:, :k]
+        distances = np.take_along_axis(chords, order, axis=1)
+        # Même convention que cKDTree : distance infinie et indice n s'il manque des voisins
+        padding = k - order.shape[1]
+        if padding > 0:
+            order = np.pad(order, ((0, 0), (0, padding)), constant_values=len(self.data))
+            distances = np.pad(distances, ((0, 0), (0, padding)), constant_values=np.inf)
+        return distances, order
+
+    def query_ball_point(self, point:np.ndarray, radius:float):
+        return np.flatnonzero(np.linalg.norm(self.data - point, axis=1) <= radius)
+
+
+def _to_unit_vectors(lat:np.ndarray, lon:np.ndarray) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord_to_meters(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(np.asarray(chord) / 2, 1))
+
+
+def _meters_to_chord(meters:float) -> float:
+    return 2 * np.sin(min(meters / EARTH_RADIUS_M, np.pi) / 2)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters, vectorized over numpy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(params=['kdtree', 'brute_force'])
+def spatial(request, monkeypatch):
+    import spatial
+    if request.param == 'brute_force':
+        monkeypatch.setattr(spatial, '_kdtree', lambda: spatial._BruteForceTree)
+    elif spatial._kdtree() is spatial._BruteForceTree:
+        pytest.skip('scipy is not installed')
+    return spatial
+
+
+@pytest.fixture
+def clean_df() -> pd.DataFrame:
+    from loader import load_clean_data
+    return load_clean_data('data/MMM_MMM_DAE.csv')
+
+
+def brute_force_distances(df, lat, lon):
+    from spatial import haversine
+    # Coordonnées inversées dans l'export : la latitude est dans long_coor1
+    distances = haversine(df['long_coor1'].to_numpy(), df['lat_coor1'].to_numpy(), lat, lon)
+    return pd.Series(distances, index=df.index).dropna()
+
+
+def test_nearest(spatial, clean_df):
+    index = spatial.DefibrillatorIndex(clean_df, lat_column='long_coor1', lon_column='lat_coor1')
+    assert len(index) == clean_df['lat_coor1'].notna().sum()
+
+    # Place de la Comédie
+    expected = brute_force_distances(clean_df, 43.6085, 3.8800).sort_values().head(3)
+    nearest = index.nearest(43.6085, 3.8800, k=3)
+    assert list(nearest.index) == list(expected.index)
+    assert np.allclose(nearest['distance_m'], expected, rtol=1e-6)
+    assert nearest['nom'].equals(clean_df.loc[expected.index, 'nom'])
+
+
+def test_within(spatial, clean_df):
+    index = spatial.DefibrillatorIndex(clean_df, lat_column='long_coor1', lon_column='lat_coor1')
+    distances = brute_force_distances(clean_df, 43.6085, 3.8800)
+    within = index.within(43.6085, 3.8800, radius_m=800)
+    assert sorted(within.index) == sorted(distances[distances <= 800].index)
+    assert within['distance_m'].is_monotonic_increasing
+
+
+def test_nearest_batch(spatial, clean_df):
+    index = spatial.DefibrillatorIndex(clean_df, lat_column='long_coor1', lon_column='lat_coor1')
+    lats, lons = np.array([43.6085, 43.57, 43.64]), np.array([3.8800, 3.85, 3.90])
+    distances, positions = index.nearest_batch(lats, lons, k=2)
+    assert distances.shape == positions.shape == (3, 2)
+    for row, (lat, lon) in enumerate(zip(lats, lons)):
+        expected = brute_force_distances(clean_df, lat, lon).sort_values().head(2)
+        assert list(clean_df.index[positions[row]]) == list(expected.index)
+        assert np.allclose(distances[row], expected, rtol=1e-6)
+
+
+def test_nearest_more_than_indexed(spatial):
+    df = pd.DataFrame({'lat_coor1': [43.6, np.nan, 43.61], 'long_coor1': [3.88, 3.9, np.nan]})
+    index = spatial.DefibrillatorIndex(df)
+    distances, positions = index.nearest_batch([43.6], [3.88], k=2)
+    assert list(positions[0]) == [0, -1] and np.isinf(distances[0, 1])
+    assert list(index.nearest(43.6, 3.88, k=5).index) == [0]
+
+
+def test_nearest_corrected_coordinates(spatial, clean_df):
+    from loader import load_clean_data
+    corrected = load_clean_data('data/MMM_MMM_DAE.csv', coordinates=True)
+    nearest = spatial.DefibrillatorIndex(corrected).nearest(43.6085, 3.8800, k=3)
+    swapped = spatial.DefibrillatorIndex(clean_df, lat_column='long_coor1', lon_column='lat_coor1')
+    assert list(nearest.index) == list(swapped.nearest(43.6085, 3.8800, k=3).index)
+
+
+def test_nearest_without_coordinates(spatial):
+    df = pd.DataFrame({'lat_coor1': [np.nan, 43.6], 'long_coor1': [3.9, np.nan]})
+    index = spatial.DefibrillatorIndex(df)
+    assert len(index) == 0
+    distances, positions = index.nearest_batch([43.6, 43.61], [3.88, 3.89], k=2)
+    assert (positions == -1).all() and np.isinf(distances).all() and positions.shape == (2, 2)
+    assert index.nearest(43.6, 3.88, k=3).empty
+    assert index.within(43.6, 3.88, radius_m=1000).empty